@@ -0,0 +1,29 @@
+"""Store metrics.metrics as JSONB
+
+Revision ID: 2f9c8b1d4e07
+Revises: e1a6c3f5b972
+Create Date: 2026-10-16 14:05:52.660418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f9c8b1d4e07'
+down_revision: Union[str, Sequence[str], None] = 'e1a6c3f5b972'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('metrics', 'metrics', existing_type=sa.JSON(), type_=postgresql.JSONB(), postgresql_using='metrics::jsonb')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('metrics', 'metrics', existing_type=postgresql.JSONB(), type_=sa.JSON(), postgresql_using='metrics::json')
@@ -0,0 +1,44 @@
+"""Store the remaining JSON columns as JSONB
+
+Revision ID: 4c8e1a7d2b59
+Revises: 7a3d5e9f1b46
+Create Date: 2026-10-16 16:48:13.502716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c8e1a7d2b59'
+down_revision: Union[str, Sequence[str], None] = '7a3d5e9f1b46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Runs before b5e2f7c8a913: TimescaleDB refuses ALTER COLUMN ... TYPE on compressed hypertables.
+_COLUMNS = (
+    ('servers', 'tags'),
+    ('servers', 'webhook_headers'),
+    ('incidents', 'correlated_data'),
+    ('metrics', 'processes'),
+    ('metrics', 'meta'),
+    ('logs', 'meta'),
+    ('traces', 'attributes'),
+    ('spans', 'attributes'),
+    ('recommendations', 'stats'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in _COLUMNS:
+        op.alter_column(table, column, existing_type=sa.JSON(), type_=postgresql.JSONB(), postgresql_using=f'{column}::jsonb')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in _COLUMNS:
+        op.alter_column(table, column, existing_type=postgresql.JSONB(), type_=sa.JSON(), postgresql_using=f'{column}::json')
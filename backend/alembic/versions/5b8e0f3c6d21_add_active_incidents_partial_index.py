@@ -0,0 +1,28 @@
+"""Add partial index on unresolved incidents
+
+Revision ID: 5b8e0f3c6d21
+Revises: c7e2d4a91f30
+Create Date: 2026-10-16 11:02:47.915306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e0f3c6d21'
+down_revision: Union[str, Sequence[str], None] = 'c7e2d4a91f30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_incidents_active_server', 'incidents', ['server_id'], unique=False, postgresql_where=sa.text('resolved_at IS NULL'), if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_incidents_active_server', table_name='incidents', if_exists=True)
@@ -0,0 +1,28 @@
+"""Add partial index on unresolved incidents by alert rule
+
+Revision ID: 7a3d5e9f1b46
+Revises: 2f9c8b1d4e07
+Create Date: 2026-10-16 14:41:18.083924
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3d5e9f1b46'
+down_revision: Union[str, Sequence[str], None] = '2f9c8b1d4e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_incidents_active_rule', 'incidents', ['alert_rule_id'], unique=False, postgresql_where=sa.text('resolved_at IS NULL'), if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_incidents_active_rule', table_name='incidents', if_exists=True)
@@ -0,0 +1,28 @@
+"""Add (server_id, level, timestamp) index on logs
+
+Revision ID: 8e0b3d6a4f12
+Revises: b5e2f7c8a913
+Create Date: 2026-10-16 17:06:29.771350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e0b3d6a4f12'
+down_revision: Union[str, Sequence[str], None] = 'b5e2f7c8a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_logs_server_level_timestamp', 'logs', ['server_id', 'level', 'timestamp'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_logs_server_level_timestamp', table_name='logs', if_exists=True)
@@ -0,0 +1,30 @@
+"""Store api_keys.key_hash as a raw SHA-256 digest
+
+Revision ID: 9d4b7a2e6c18
+Revises: 5b8e0f3c6d21
+Create Date: 2026-10-16 12:20:31.506842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b7a2e6c18'
+down_revision: Union[str, Sequence[str], None] = '5b8e0f3c6d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows hold the hex digest; decode them in place, the unique index is rebuilt by Postgres.
+    op.alter_column('api_keys', 'key_hash', existing_type=sa.String(), type_=sa.LargeBinary(length=32), existing_nullable=False, postgresql_using="decode(key_hash, 'hex')")
+    op.create_index(op.f('ix_api_keys_key_hash'), 'api_keys', ['key_hash'], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('api_keys', 'key_hash', existing_type=sa.LargeBinary(length=32), type_=sa.String(), existing_nullable=False, postgresql_using="encode(key_hash, 'hex')")
@@ -0,0 +1,33 @@
+"""Add server/timestamp composite indexes
+
+Revision ID: a3f1c9d27b64
+Revises: 662c933dc5bc
+Create Date: 2026-10-16 09:12:04.381527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f1c9d27b64'
+down_revision: Union[str, Sequence[str], None] = '662c933dc5bc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # metrics was created with create_all, so its index may already exist
+    op.create_index('idx_metrics_server_timestamp', 'metrics', ['server_id', 'timestamp'], unique=False, if_not_exists=True)
+    op.create_index('idx_logs_server_timestamp', 'logs', ['server_id', sa.text('timestamp DESC')], unique=False, if_not_exists=True)
+    op.create_index('idx_incidents_server_triggered_at', 'incidents', ['server_id', sa.text('triggered_at DESC')], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_incidents_server_triggered_at', table_name='incidents', if_exists=True)
+    op.drop_index('idx_logs_server_timestamp', table_name='logs', if_exists=True)
+    op.drop_index('idx_metrics_server_timestamp', table_name='metrics', if_exists=True)
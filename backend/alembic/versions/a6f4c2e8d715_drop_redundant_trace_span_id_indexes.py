@@ -0,0 +1,31 @@
+"""Drop redundant id indexes on traces and spans
+
+Revision ID: a6f4c2e8d715
+Revises: d3a9f6b2c871
+Create Date: 2026-10-16 17:52:09.640381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6f4c2e8d715'
+down_revision: Union[str, Sequence[str], None] = 'd3a9f6b2c871'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Both columns are already the primary key, which carries its own unique index.
+    op.drop_index(op.f('ix_spans_id'), table_name='spans', if_exists=True)
+    op.drop_index(op.f('ix_traces_id'), table_name='traces', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_traces_id'), 'traces', ['id'], unique=False, if_not_exists=True)
+    op.create_index(op.f('ix_spans_id'), 'spans', ['id'], unique=False, if_not_exists=True)
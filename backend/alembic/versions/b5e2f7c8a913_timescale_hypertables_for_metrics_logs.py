@@ -0,0 +1,62 @@
+"""Convert metrics and logs to TimescaleDB hypertables where available
+
+Revision ID: b5e2f7c8a913
+Revises: 4c8e1a7d2b59
+Create Date: 2026-10-16 16:22:37.148905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e2f7c8a913'
+down_revision: Union[str, Sequence[str], None] = '4c8e1a7d2b59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Append-only telemetry tables. traces/spans stay plain tables: spans reference them by FK,
+# which hypertables can't be the target of.
+_HYPERTABLES = ('metrics', 'logs')
+_COMPRESS_AFTER = '7 days'
+
+
+def _timescale_available() -> bool:
+    # Cloud SQL doesn't ship the extension; there this migration is a no-op. A packaged but not
+    # preloaded extension can't be created either: skip it too (f2b7d9c4e683 then partitions the tables).
+    return op.get_bind().execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') "
+        "OR (EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb') "
+        "AND 'timescaledb' = ANY (string_to_array(replace(current_setting('shared_preload_libraries'), ' ', ''), ',')))"
+    )).scalar()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _timescale_available():
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+    for table in _HYPERTABLES:
+        # Unique constraints on a hypertable must include the partitioning column.
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.create_primary_key(f'{table}_pkey', table, ['id', 'timestamp'])
+        op.execute(
+            f"SELECT create_hypertable('{table}', 'timestamp', chunk_time_interval => INTERVAL '1 day', migrate_data => true)"
+        )
+        op.execute(
+            f"ALTER TABLE {table} SET (timescaledb.compress, timescaledb.compress_segmentby = 'server_id', "
+            f"timescaledb.compress_orderby = 'timestamp DESC')"
+        )
+        op.execute(f"SELECT add_compression_policy('{table}', INTERVAL '{_COMPRESS_AFTER}')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # A hypertable can't be turned back into a plain table in place; only the policies are removed.
+    if not _timescale_available():
+        return
+    for table in _HYPERTABLES:
+        op.execute(f"SELECT remove_compression_policy('{table}', if_exists => true)")
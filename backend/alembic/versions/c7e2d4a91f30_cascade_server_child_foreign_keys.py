@@ -0,0 +1,49 @@
+"""Cascade deletes from servers to their child rows
+
+Revision ID: c7e2d4a91f30
+Revises: a3f1c9d27b64
+Create Date: 2026-10-16 10:41:27.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e2d4a91f30'
+down_revision: Union[str, Sequence[str], None] = 'a3f1c9d27b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referenced table) for every FK that should cascade
+_CASCADED_FOREIGN_KEYS = [
+    ('api_keys', 'server_id', 'servers'),
+    ('metrics', 'server_id', 'servers'),
+    ('logs', 'server_id', 'servers'),
+    ('alert_rules', 'server_id', 'servers'),
+    ('incidents', 'server_id', 'servers'),
+    ('incidents', 'alert_rule_id', 'alert_rules'),
+    ('recommendations', 'server_id', 'servers'),
+    ('metric_baselines', 'server_id', 'servers'),
+    ('traces', 'server_id', 'servers'),
+    ('spans', 'trace_id', 'traces'),
+    ('spans', 'parent_id', 'spans'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column, referred_table in _CASCADED_FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred_table, [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column, referred_table in _CASCADED_FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred_table, [column], ['id'])
@@ -0,0 +1,33 @@
+"""Store incidents.status as a native enum
+
+Revision ID: d3a9f6b2c871
+Revises: 8e0b3d6a4f12
+Create Date: 2026-10-16 17:31:44.218057
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a9f6b2c871'
+down_revision: Union[str, Sequence[str], None] = '8e0b3d6a4f12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+incident_status = postgresql.ENUM('investigating', 'active', 'resolved', name='incident_status')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    incident_status.create(op.get_bind(), checkfirst=True)
+    op.alter_column('incidents', 'status', existing_type=sa.String(), type_=incident_status, postgresql_using='status::incident_status')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('incidents', 'status', existing_type=incident_status, type_=sa.String(), postgresql_using='status::text')
+    incident_status.drop(op.get_bind(), checkfirst=True)
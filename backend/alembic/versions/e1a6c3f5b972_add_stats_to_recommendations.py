@@ -0,0 +1,28 @@
+"""Add stats to recommendations
+
+Revision ID: e1a6c3f5b972
+Revises: 9d4b7a2e6c18
+Create Date: 2026-10-16 12:48:09.274150
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a6c3f5b972'
+down_revision: Union[str, Sequence[str], None] = '9d4b7a2e6c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('recommendations', sa.Column('stats', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('recommendations', 'stats')
@@ -0,0 +1,103 @@
+"""Partition metrics and logs by month when TimescaleDB isn't installed
+
+Revision ID: f2b7d9c4e683
+Revises: a6f4c2e8d715
+Create Date: 2026-10-16 18:14:52.907214
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7d9c4e683'
+down_revision: Union[str, Sequence[str], None] = 'a6f4c2e8d715'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Secondary indexes of each table (as declared on the models); created on the partitioned parent,
+# which propagates them to every partition.
+_INDEXES = {
+    'metrics': [
+        'CREATE INDEX idx_metrics_server_timestamp ON metrics (server_id, "timestamp")',
+    ],
+    'logs': [
+        'CREATE INDEX ix_logs_server_id ON logs (server_id)',
+        'CREATE INDEX ix_logs_timestamp ON logs ("timestamp")',
+        'CREATE INDEX ix_logs_level ON logs (level)',
+        'CREATE INDEX idx_logs_server_timestamp ON logs (server_id, "timestamp" DESC)',
+        'CREATE INDEX idx_logs_server_level_timestamp ON logs (server_id, level, "timestamp")',
+    ],
+}
+# Partitions created beyond the current month; crud.ensure_telemetry_partitions keeps this window rolling.
+_MONTHS_AHEAD = 2
+# Months of existing data that get their own partition; older rows go to the DEFAULT partition. A fixed
+# window, not min("timestamp"): one row from an agent with a 1970 clock would mean hundreds of partitions.
+_MONTHS_BACK = 12
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _timescale_installed() -> bool:
+    return op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+    ).scalar() is not None
+
+
+def _rebuild(table: str, partitioned: bool) -> None:
+    """Recreates table (partitioned by month or plain), copies the rows over and restores its keys and indexes."""
+    bind = op.get_bind()
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    if partitioned:
+        op.execute(f'CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        oldest = bind.execute(sa.text(f'SELECT min("timestamp") FROM {table}_old')).scalar()
+        this_month = date.today().replace(day=1)
+        first_month = _add_months(this_month, -_MONTHS_BACK)
+        month = max(oldest.date().replace(day=1), first_month) if oldest else this_month
+        while month <= _add_months(this_month, _MONTHS_AHEAD):
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )
+            month = _add_months(month, 1)
+        # Rows outside the pre-created months (older data, agents with a wrong clock) still have somewhere to go.
+        op.execute(f"CREATE TABLE {table}_pdefault PARTITION OF {table} DEFAULT")
+        # A partitioned table's primary key has to contain the partition column, which makes it NOT NULL;
+        # rows without a timestamp can't be placed on a time axis anyway and are left behind.
+        primary_key = 'id, "timestamp"'
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "timestamp" SET NOT NULL')
+        op.execute(f'INSERT INTO {table} SELECT * FROM {table}_old WHERE "timestamp" IS NOT NULL')
+    else:
+        op.execute(f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS)")
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "timestamp" DROP NOT NULL')
+        primary_key = 'id'
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+
+    op.execute(f"DROP TABLE {table}_old")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({primary_key})")
+    op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY (server_id) REFERENCES servers (id) ON DELETE CASCADE")
+    for statement in _INDEXES[table]:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # With TimescaleDB the hypertables from b5e2f7c8a913 already chunk these tables by time.
+    if _timescale_installed():
+        return
+    for table in _INDEXES:
+        _rebuild(table, partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _timescale_installed():
+        return
+    for table in _INDEXES:
+        _rebuild(table, partitioned=False)
@@ -34,7 +34,7 @@ def calculate_baselines():
                 metric_value_subquery = literal_column(
                     f"""
                         (SELECT CAST(elem ->> 'value' AS float)
-                         FROM jsonb_array_elements(metrics.metrics::jsonb) AS elem
+                         FROM jsonb_array_elements(metrics.metrics) AS elem
                         WHERE elem ->> 'name' = '{metric_name}')
                     """
                 )
@@ -1,22 +1,36 @@
+import io
+import orjson
 from sqlalchemy.orm import Session
 from . import models, schemas
 from sqlalchemy.orm import joinedload
 from uuid import UUID
-from datetime import datetime
-from sqlalchemy import desc
+from datetime import date, datetime
+from sqlalchemy import desc, insert, text
 
-def create_recommendation(db: Session, server_id: UUID, rec_type: schemas.RecommendationType, summary: str) -> models.Recommendation:
+# Batches at least this large are streamed with COPY; smaller ones use a multi-row INSERT.
+COPY_MIN_ROWS = 100
+
+def create_recommendation(db: Session, server_id: UUID, rec_type: schemas.RecommendationType, summary: str, stats: dict | None = None) -> models.Recommendation:
     """Creates a new recommendation record in the database."""
     db_recommendation = models.Recommendation(
         server_id=server_id,
         recommendation_type=rec_type,
-        summary=summary
+        summary=summary,
+        stats=stats
     )
     db.add(db_recommendation)
     db.commit()
     db.refresh(db_recommendation)
     return db_recommendation
 
+def create_recommendations(db: Session, recommendations: list[dict]) -> int:
+    """Inserts many recommendation records in a single round trip."""
+    if not recommendations:
+        return 0
+    db.bulk_insert_mappings(models.Recommendation, recommendations)
+    db.commit()
+    return len(recommendations)
+
 def get_latest_recommendation_for_server(db: Session, server_id: UUID) -> models.Recommendation | None:
     """Retrieves the most recent recommendation for a given server."""
     return db.query(models.Recommendation).filter(
@@ -77,3 +91,103 @@ def save_metrics(db: Session, metrics: list[schemas.MetricIn]):
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
+
+def _copy_csv_field(value) -> str:
+    """One CSV field for COPY: \\N for NULL, everything else quoted (so '' stays an empty string)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = orjson.dumps(value).decode()
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+def copy_rows(db: Session, table, rows: list[dict]):
+    """
+    Streams row mappings into table with COPY ... FROM STDIN on the session's own
+    connection, so the rows are part of its transaction and land on db.commit().
+    """
+    columns = list(rows[0])
+    data = "\n".join(",".join(_copy_csv_field(row[column]) for column in columns) for row in rows)
+    sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"): # psycopg2 (local DATABASE_URL)
+            cursor.copy_expert(sql, io.StringIO(data))
+        else: # pg8000 (Cloud SQL connector)
+            cursor.execute(sql, stream=io.BytesIO(data.encode()))
+    finally:
+        cursor.close()
+
+def bulk_insert_rows(db: Session, model, rows: list[dict]):
+    """Inserts telemetry row mappings: COPY for large batches, one multi-row INSERT otherwise."""
+    if not rows:
+        return
+    # Primary keys for the whole batch come from one clock read and one entropy call instead of
+    # a column-default uuid7() per row (COPY bypasses column defaults anyway).
+    rows = [{"id": id_, **row} for id_, row in zip(models.uuid7_batch(len(rows)), rows)]
+    if len(rows) < COPY_MIN_ROWS:
+        db.execute(insert(model), rows)
+        return
+    copy_rows(db, model.__table__, rows)
+
+# Monthly partitions kept ready ahead of the current month (see the f2b7d9c4e683 migration).
+PARTITION_MONTHS_AHEAD = 2
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _create_month_partition(db: Session, table: str, month: date):
+    partition = f"{table}_p{month:%Y_%m}"
+    default_partition = f"{table}_pdefault"
+    lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+    # Built detached and attached afterwards: Postgres refuses a range the DEFAULT partition
+    # already holds rows for (e.g. future-dated rows from an agent with a skewed clock), so
+    # those rows are moved in first, with inserts into the default held off until the attach.
+    db.execute(text(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)"))
+    if db.execute(text("SELECT to_regclass(:partition)"), {"partition": default_partition}).scalar():
+        db.execute(text(f"LOCK TABLE {default_partition} IN SHARE ROW EXCLUSIVE MODE"))
+        db.execute(text(
+            f"WITH moved AS (DELETE FROM {default_partition} "
+            f"WHERE \"timestamp\" >= '{lower}' AND \"timestamp\" < '{upper}' RETURNING *) "
+            f"INSERT INTO {partition} SELECT * FROM moved"
+        ))
+    db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+
+def ensure_telemetry_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Creates any missing monthly partitions of metrics/logs up to months_ahead past the current month.
+    No-op for tables that aren't range-partitioned (TimescaleDB hypertables, or a create_all schema).
+    Each table is handled in its own transaction, so a failure on one doesn't hold back the other;
+    failures are raised once both tables have been tried. Returns the number of partitions created.
+    """
+    created = 0
+    failures = []
+    this_month = date.today().replace(day=1)
+    for table in (models.Metric.__tablename__, models.Log.__tablename__):
+        try:
+            partitioned = db.execute(
+                text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+            ).scalar()
+            if not partitioned:
+                db.rollback()
+                continue
+            table_created = 0
+            for offset in range(months_ahead + 1):
+                month = _add_months(this_month, offset)
+                if db.execute(text("SELECT to_regclass(:partition)"), {"partition": f"{table}_p{month:%Y_%m}"}).scalar():
+                    continue
+                _create_month_partition(db, table, month)
+                table_created += 1
+            db.commit()
+            created += table_created
+        except Exception as e:
+            db.rollback()
+            failures.append(f"{table}: {e}")
+    if failures:
+        raise RuntimeError("Could not create telemetry partitions (" + "; ".join(failures) + ")")
+    return created
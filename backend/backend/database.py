@@ -1,4 +1,5 @@
 import os
+import orjson
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from google.cloud.sql.connector import Connector, IPTypes
@@ -11,6 +12,19 @@ Base = declarative_base()
 _engine = None
 _SessionLocal = None
 
+# Shared by request handlers and background jobs, so size the pool for both.
+_POOL_OPTIONS = {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True}
+# Compiled-SQL cache: room for every endpoint's queries plus the relationship loaders
+# (the default of 500 can churn once all of them are warm).
+_QUERY_CACHE_SIZE = 1200
+
+def _json_serializer(value) -> str:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+# JSON/JSONB bind values and results go through orjson instead of the stdlib json module
+# (SQLAlchemy also registers the loader with psycopg2, which decodes json columns itself).
+_JSON_OPTIONS = {"json_serializer": _json_serializer, "json_deserializer": orjson.loads}
+
 def _create_and_configure_engine():
     """Helper to create the SQLAlchemy engine and sessionmaker based on environment."""
     global _engine, _SessionLocal
@@ -27,28 +41,30 @@ def _create_and_configure_engine():
                 user=os.environ["DB_USER"], password=os.environ["DB_PASS"],
                 db=os.environ["DB_NAME"], ip_type=IPTypes.PUBLIC
             )
-        _engine = create_engine("postgresql+pg8000://", creator=getconn)
+        _engine = create_engine("postgresql+pg8000://", creator=getconn, query_cache_size=_QUERY_CACHE_SIZE, **_POOL_OPTIONS, **_JSON_OPTIONS)
     else: 
         DATABASE_URL = os.getenv("DATABASE_URL")
         if not DATABASE_URL:
             raise ValueError("DATABASE_URL environment variable not set for local development")
-        _engine = create_engine(DATABASE_URL)
+        _engine = create_engine(DATABASE_URL, query_cache_size=_QUERY_CACHE_SIZE, **_POOL_OPTIONS, **_JSON_OPTIONS)
 
     _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=_engine) 
     Base.metadata.create_all(bind=_engine)
     print("Database engine and session factory configured and tables created.")
+    print(f"Database pool: {_engine.pool.status()}; compiled query cache size: {_QUERY_CACHE_SIZE}")
  
-def get_db_session_for_background():
+def get_db_session_for_background(expire_on_commit: bool = True):
     """
     Provides a fresh DB session for background tasks.
     Ensures database engine and session factory are initialized if not already.
+    expire_on_commit=False keeps loaded objects readable after a commit without a refresh SELECT.
     """
     if _SessionLocal is None: 
         _create_and_configure_engine()
         if _SessionLocal is None:
              raise RuntimeError("Failed to initialize database session factory after attempt.")
     
-    return _SessionLocal()  
+    return _SessionLocal(expire_on_commit=expire_on_commit)
  
 def get_db():
     """Provides a DB session for FastAPI request-response cycle."""
@@ -2,39 +2,46 @@ import secrets
 import hashlib
 import asyncio
 import os 
+import threading
+import time
+import zlib
+import anyio
 import google.generativeai as genai 
-import requests
-import json
+import httpx
+import orjson
 import numpy as np
 
 from fastapi import APIRouter, FastAPI, Depends, Request, Security, status, HTTPException, Query, WebSocket, WebSocketDisconnect, Response, BackgroundTasks
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from . import crud, security
-from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware  
 from starlette.concurrency import run_in_threadpool  
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
-from sqlalchemy.orm import Session, joinedload, sessionmaker
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc, create_engine 
-from backend.database import SessionLocal, engine, Base, get_db, initialize_database
+from sqlalchemy import case, delete, desc, func, insert, text, update
+from backend.database import SessionLocal, Base, get_db, initialize_database
 from backend import models, schemas 
 from backend.security import create_access_token, verify_access_token, decode_jwt
 from uuid import UUID
-from typing import List, Optional, Any, Dict
+from typing import List, Optional, Any, Dict, Tuple
 from .websocket_manager import ConnectionManager 
-from datetime import datetime, timedelta 
-from pydantic import BaseModel
+from .pubsub_hub import MetricsSubscriptionHub
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 from authlib.integrations.starlette_client import OAuth
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import pubsub_v1
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from cachetools import TTLCache
 from contextlib import asynccontextmanager
 
 from server_metrics_apm import init_apm, APMMiddleware 
@@ -49,9 +56,26 @@ APM_BACKEND_URL_SELF = os.getenv("APM_BACKEND_URL_SELF") # Endpoint where *this*
 APM_SERVER_ID_SELF_STR = os.getenv("APM_SERVER_ID_SELF") # A unique ID for *this* backend instance
 APM_AUTH_TOKEN_SELF = os.getenv("APM_AUTH_TOKEN_SELF") # An API Key or JWT for this backend to authenticate its traces
 
+# Worker threads shared by sync endpoints/background tasks (anyio) and asyncio.to_thread (DB commits, RPCs)
+THREADPOOL_TOKENS = int(os.getenv("THREADPOOL_TOKENS", "200"))
 
-publisher = pubsub_v1.PublisherClient()
+
+# publish() only enqueues into the client's batch and returns a future; messages
+# are flushed every 100 items, 1 MB or 50 ms, whichever comes first.
+publisher = pubsub_v1.PublisherClient(
+    batch_settings=pubsub_v1.types.BatchSettings(
+        max_messages=100,
+        max_bytes=1_000_000,
+        max_latency=0.05,
+    )
+)
 topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
+metrics_hub = MetricsSubscriptionHub(PROJECT_ID, topic_path)
+
+def _log_publish_failure(future):
+    """Done-callback for publish futures; delivery is fire-and-forget, failures are only logged."""
+    if future.exception() is not None:
+        print(f"ERROR: Failed to publish metric to Pub/Sub: {future.exception()}")
 
 # --- Security & Auth Setup ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -88,44 +112,126 @@ oauth.register(
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 # --- Right-Sizing Analysis Notification Functions ---
-def generate_right_sizing_recommendation(server_id: UUID):
-    """Analyzes 30 days of metrics for a server and generates a right-sizing recommendation."""
+RIGHT_SIZING_LOOKBACK_DAYS = 30
+RIGHT_SIZING_MIN_SAMPLES = 10
+# A recommendation whose bucketed stats still match is kept for this long instead of asking Gemini again.
+RIGHT_SIZING_REUSE_DAYS = 7
+
+def _right_sizing_stats_by_server(db: Session) -> Dict[UUID, Dict[str, float]]:
+    """
+    Computes average and p95 CPU/memory per server over the lookback window in a single
+    aggregate query, so the daily job never pulls raw metric rows into Python.
+    Servers with fewer than RIGHT_SIZING_MIN_SAMPLES samples are left out.
+    """
+    rows = db.execute(
+        text(f"""
+            SELECT samples.server_id,
+                   AVG(samples.cpu) AS avg_cpu,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY samples.cpu) AS p95_cpu,
+                   AVG(samples.mem) AS avg_mem,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY samples.mem) AS p95_mem
+            FROM (
+                SELECT metrics.server_id,
+                       {_ALERT_METRIC_VALUE_SQL[models.AlertMetric.CPU]} AS cpu,
+                       {_ALERT_METRIC_VALUE_SQL[models.AlertMetric.MEMORY]} AS mem
+                FROM metrics
+                WHERE metrics.timestamp >= :since
+            ) AS samples
+            GROUP BY samples.server_id
+            HAVING COUNT(*) >= :min_samples
+        """),
+        {
+            "since": datetime.utcnow() - timedelta(days=RIGHT_SIZING_LOOKBACK_DAYS),
+            "min_samples": RIGHT_SIZING_MIN_SAMPLES,
+        },
+    ).all()
+
+    return {
+        row.server_id: {
+            "avg_cpu": row.avg_cpu or 0.0,
+            "p95_cpu": row.p95_cpu or 0.0,
+            "avg_mem": row.avg_mem or 0.0,
+            "p95_mem": row.p95_mem or 0.0,
+        }
+        for row in rows
+    }
+
+def _mean_and_p95(values: np.ndarray) -> Tuple[float, float]:
+    """
+    Mean and 95th percentile (linear interpolation, same as np.percentile's default) of the
+    finite values. p95 uses np.partition (introselect) so the array is never fully sorted.
+    """
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return 0.0, 0.0
+    rank = 0.95 * (values.size - 1)
+    lower = int(rank)
+    upper = min(lower + 1, values.size - 1)
+    partitioned = np.partition(values, (lower, upper))
+    p95 = partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (rank - lower)
+    return float(values.mean()), float(p95)
+
+def generate_right_sizing_recommendation(server_id: UUID, stats: Optional[Dict[str, float]] = None, persist: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Analyzes 30 days of metrics for a server and generates a right-sizing recommendation.
+    When stats (see _right_sizing_stats_by_server) are passed in, the metrics aren't re-read.
+    Returns the recommendation as a row mapping; when persist is False the caller is
+    responsible for storing it (see run_analysis_for_all_servers).
+    """
     print(f"Starting right-sizing analysis for server {server_id}...")
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url or not genai_model:
-        print("Analysis skipped: DATABASE_URL or Gemini API not configured.")
+    if not genai_model:
+        print("Analysis skipped: Gemini API not configured.")
         return
 
-    if "127.0.0.1" in db_url or "localhost" in db_url:
-        db_url = db_url.replace("postgresql+pg8000", "postgresql+psycopg2")
-
     try:
-        engine = create_engine(db_url)
-        SessionLocal_BG = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        db = SessionLocal_BG()
+        db = SessionLocal()
     except Exception as e:
         print(f"Analysis failed for {server_id}: Could not create DB session: {e}")
         return
 
     try:
-        # Fetch last 30 days of metrics
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        metrics = db.query(models.Metric.metrics).filter(
-            models.Metric.server_id == server_id,
-            models.Metric.timestamp >= thirty_days_ago
-        ).all()
-
-        if len(metrics) < 10:  
-            print(f"Analysis skipped for {server_id}: Not enough metric data.")
-            return 
-        
-        cpu_usage = [m[0].get('cpu_usage', 0) for m in metrics]
-        mem_usage = [m[0].get('memory_usage', 0) for m in metrics]
-
-        avg_cpu = np.mean(cpu_usage)
-        p95_cpu = np.percentile(cpu_usage, 95)
-        avg_mem = np.mean(mem_usage)
-        p95_mem = np.percentile(mem_usage, 95)
+        if stats is None:
+            # Fetch last 30 days of CPU/memory values, extracted from the JSON in Postgres
+            thirty_days_ago = datetime.utcnow() - timedelta(days=RIGHT_SIZING_LOOKBACK_DAYS)
+            metrics = db.execute(
+                text(f"""
+                    SELECT COALESCE({_ALERT_METRIC_VALUE_SQL[models.AlertMetric.CPU]}, 0) AS cpu,
+                           COALESCE({_ALERT_METRIC_VALUE_SQL[models.AlertMetric.MEMORY]}, 0) AS mem
+                    FROM metrics
+                    WHERE metrics.server_id = :server_id AND metrics.timestamp >= :since
+                """),
+                {"server_id": str(server_id), "since": thirty_days_ago},
+            ).all()
+
+            if len(metrics) < RIGHT_SIZING_MIN_SAMPLES:  
+                print(f"Analysis skipped for {server_id}: Not enough metric data.")
+                return 
+            
+            cpu_usage = np.fromiter((m.cpu for m in metrics), dtype=np.float32, count=len(metrics))
+            mem_usage = np.fromiter((m.mem for m in metrics), dtype=np.float32, count=len(metrics))
+
+            avg_cpu, p95_cpu = _mean_and_p95(cpu_usage)
+            avg_mem, p95_mem = _mean_and_p95(mem_usage)
+            stats = {"avg_cpu": avg_cpu, "p95_cpu": p95_cpu, "avg_mem": avg_mem, "p95_mem": p95_mem}
+
+        avg_cpu = stats["avg_cpu"]
+        p95_cpu = stats["p95_cpu"]
+        avg_mem = stats["avg_mem"]
+        p95_mem = stats["p95_mem"]
+
+        # Steady servers land in the same 5% buckets day after day.
+        bucketed_stats = {
+            key: int(round(float(value) / 5)) * 5
+            for key, value in (("avg_cpu", avg_cpu), ("p95_cpu", p95_cpu), ("avg_mem", avg_mem), ("p95_mem", p95_mem))
+        }
+        latest = crud.get_latest_recommendation_for_server(db, server_id)
+        if (
+            latest is not None
+            and latest.stats == bucketed_stats
+            and latest.created_at > datetime.now(timezone.utc) - timedelta(days=RIGHT_SIZING_REUSE_DAYS)
+        ):
+            print(f"Analysis skipped for {server_id}: usage unchanged since the last recommendation.")
+            return
 
         # AI Prompt
         prompt = f"""
@@ -154,41 +260,92 @@ def generate_right_sizing_recommendation(server_id: UUID):
         }}
         """
  
-        response = genai_model.generate_content(prompt)
+        # Another server with the same profile may already have been answered.
+        cache_key = _gemini_cache_key("right-sizing", bucketed_stats)
+        response_text = _gemini_cache_get(_right_sizing_cache, cache_key)
+        if response_text is None:
+            response_text = genai_model.generate_content(prompt).text
          
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        rec_data = json.loads(cleaned_response)
+        cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
+        rec_data = orjson.loads(cleaned_response)
+        _gemini_cache_set(_right_sizing_cache, cache_key, response_text)
+        recommendation = {
+            "server_id": server_id,
+            "recommendation_type": rec_data["recommendation_type"],
+            "summary": rec_data["summary"],
+            "stats": bucketed_stats,
+        }
 
-        crud.create_recommendation(
-            db=db,
-            server_id=server_id,
-            rec_type=rec_data["recommendation_type"],
-            summary=rec_data["summary"]
-        )
-        print(f"Successfully generated and stored recommendation for server {server_id}.")
+        if persist:
+            crud.create_recommendation(
+                db=db,
+                server_id=server_id,
+                rec_type=recommendation["recommendation_type"],
+                summary=recommendation["summary"],
+                stats=recommendation["stats"]
+            )
+            print(f"Successfully generated and stored recommendation for server {server_id}.")
+        return recommendation
 
     except Exception as e:
         print(f"An error occurred during analysis for server {server_id}: {e}")
     finally:
         db.close()
 
-def run_analysis_for_all_servers():
+RIGHT_SIZING_CONCURRENCY = 8
+
+async def run_analysis_for_all_servers():
     """Job to be run by the scheduler."""
     print("Scheduler starting daily right-sizing analysis for all servers...")
     db = SessionLocal()
     try:
-        servers = db.query(models.Server).all()
-        for server in servers:
-            generate_right_sizing_recommendation(server.id)
+        stats_by_server = await asyncio.to_thread(_right_sizing_stats_by_server, db)
+        print(f"Found {len(stats_by_server)} servers with enough metric data.")
+
+        # The Gemini calls are I/O-bound; run up to RIGHT_SIZING_CONCURRENCY of them at once.
+        semaphore = asyncio.Semaphore(RIGHT_SIZING_CONCURRENCY)
+
+        async def analyze(server_id, stats):
+            async with semaphore:
+                return await asyncio.to_thread(generate_right_sizing_recommendation, server_id, stats, False)
+
+        results = await asyncio.gather(*(analyze(server_id, stats) for server_id, stats in stats_by_server.items()))
+        recommendations = [recommendation for recommendation in results if recommendation]
+
+        # One multi-row INSERT and a single commit for the whole run.
+        stored = await asyncio.to_thread(crud.create_recommendations, db, recommendations)
+        print(f"Stored {stored} right-sizing recommendations.")
     finally:
         db.close()
     print("Scheduler finished daily analysis.")
   
+def maintain_telemetry_partitions():
+    """Job to be run by the scheduler: keeps the next months' metrics/logs partitions in place."""
+    db = SessionLocal()
+    try:
+        created = crud.ensure_telemetry_partitions(db)
+        if created:
+            print(f"Created {created} telemetry partitions.")
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating telemetry partitions: {e}")
+    finally:
+        db.close()
+
 scheduler = AsyncIOScheduler()
-scheduler.add_job(run_analysis_for_all_servers, 'interval', days=1)
+# A late or overlapping wake-up runs the daily job once rather than back-to-back.
+scheduler.add_job(run_analysis_for_all_servers, 'interval', days=1, coalesce=True, max_instances=1, misfire_grace_time=3600)
+scheduler.add_job(maintain_telemetry_partitions, 'interval', days=1, next_run_time=datetime.now(), coalesce=True, max_instances=1, misfire_grace_time=3600)
+
+# Event loop the app runs on; set in lifespan so sync background tasks can schedule work on it.
+_main_loop: Optional[asyncio.AbstractEventLoop] = None
  
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global _main_loop
+    _main_loop = asyncio.get_running_loop()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    _main_loop.set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_TOKENS))
     initialize_database()
     scheduler.start()
 
@@ -207,8 +364,10 @@ async def lifespan(app: FastAPI):
     yield
     print("Shutting down...")
     scheduler.shutdown()
+    await metrics_hub.close()
+    webhook_client.close()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(APMMiddleware)
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
@@ -237,8 +396,11 @@ app.add_middleware(
 auth_scheme = HTTPBearer(auto_error=True)
 manager = ConnectionManager()
  
+# Built once; the client holds no per-message state.
+sendgrid_client = SendGridAPIClient(SENDGRID_API_KEY) if SENDGRID_API_KEY else None
+
 def send_email_notification(recipient_email: str, subject: str, body: str):
-    if not SENDGRID_API_KEY or not SMTP_SENDER_EMAIL:
+    if not sendgrid_client or not SMTP_SENDER_EMAIL:
         print("WARNING: SendGrid API Key or Sender Email not configured. Skipping email notification.")
         return
 
@@ -249,12 +411,21 @@ def send_email_notification(recipient_email: str, subject: str, body: str):
         plain_text_content=body
     )
     try:
-        sendgrid_client = SendGridAPIClient(SENDGRID_API_KEY)
         response = sendgrid_client.send(message)
         print(f"Notification email sent to {recipient_email}, status code: {response.status_code}")
     except Exception as e:
         print(f"ERROR: Failed to send email via SendGrid to {recipient_email}: {e}")
 
+# Shared keep-alive pool for webhook deliveries; closed in lifespan shutdown.
+webhook_client = httpx.Client(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=5.0,
+)
+
+# Webhook colors indexed by is_firing: (resolved, firing)
+_TEAMS_COLORS = ("00FF00", "FF0000") # Green for resolved, Red for firing
+_EMBED_COLORS = (3066993, 15548997)
+
 # Webhook notification function
 def send_webhook_notification(webhook_url: str, webhook_format: str, subject: str, body: str, is_firing: bool, headers: Optional[Dict[str, str]] = None):
     """Sends a notification to a webhook, formatting it based on the specified type."""
@@ -262,11 +433,10 @@ def send_webhook_notification(webhook_url: str, webhook_format: str, subject: st
     
     if webhook_format == 'teams':
         # Format for Microsoft Teams
-        color = "FF0000" if is_firing else "00FF00" # Red for firing, Green for resolved
         payload = {
             "@type": "MessageCard",
             "@context": "http://schema.org/extensions",
-            "themeColor": color,
+            "themeColor": _TEAMS_COLORS[is_firing],
             "summary": subject,
             "sections": [{
                 "activityTitle": subject,
@@ -275,30 +445,47 @@ def send_webhook_notification(webhook_url: str, webhook_format: str, subject: st
             }]
         }
     else: # Default to Slack/Discord format
-        color = 15548997 if is_firing else 3066993
         payload = {
             "embeds": [{
                 "title": subject,
                 "description": body,
-                "color": color,
+                "color": _EMBED_COLORS[is_firing],
                 "timestamp": datetime.utcnow().isoformat()
             }]
         }
 
+    # Encoded with orjson and sent as raw bytes so httpx doesn't json.dumps it again.
+    request_headers = {"Content-Type": "application/json", **(headers or {})}
     try: 
-        response = requests.post(webhook_url, json=payload, headers=headers, timeout=5)
+        response = webhook_client.post(webhook_url, content=orjson.dumps(payload), headers=request_headers)
         response.raise_for_status()
         print(f"Webhook notification sent successfully using {webhook_format} format.")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"ERROR: Failed to send webhook notification: {e}")
  
 # --- Dependency to get current user ---
+# token -> (user_id, exp) for recently verified tokens; a dashboard page fires many requests with the same token.
+_user_token_cache = TTLCache(maxsize=10_000, ttl=60)
+_user_token_cache_lock = threading.Lock()
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    with _user_token_cache_lock:
+        cached = _user_token_cache.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at is None or expires_at > time.time():
+            user = db.get(models.User, user_id)
+            if user is not None:
+                return user
+        with _user_token_cache_lock:
+            _user_token_cache.pop(token, None)
+
     try:
         payload = decode_jwt(token)
         email: str = payload.get("sub")
@@ -310,8 +497,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     user = db.query(models.User).filter(models.User.email == email).first()
     if user is None:
         raise credentials_exception
+
+    with _user_token_cache_lock:
+        _user_token_cache[token] = (user.id, payload.get("exp"))
     return user
 
+def _user_owns_server(db: Session, server_id, user_id) -> bool:
+    """Ownership gate as an EXISTS query; no Server row is loaded."""
+    return db.query(
+        db.query(models.Server.id).filter(
+            models.Server.id == server_id,
+            models.Server.user_id == user_id
+        ).exists()
+    ).scalar()
+
+def owned_server(
+    server_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+) -> models.Server:
+    """Dependency for /servers/{server_id} routes that need the row: the current user's server or 404."""
+    server = db.get(models.Server, server_id)
+    if server is None or server.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Server not found or permission denied.")
+    return server
+
 # --- New Auth Router ---
 auth_router = APIRouter(prefix="/api/v1/auth", tags=["authentication"])
 
@@ -329,10 +539,14 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
+# Sync on purpose: the argon2id/bcrypt check is CPU-bound, so it runs in the threadpool, not on the event loop.
 @auth_router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not user.hashed_password or not security.verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = (False, None)
+    if user and user.hashed_password:
+        verified, new_hash = security.verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -340,6 +554,10 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    if new_hash:
+        # bcrypt (or outdated argon2 parameters) -> rehash with the current settings
+        user.hashed_password = new_hash
+        db.commit()
         
     access_token = security.create_access_token(subject=user.email)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -409,21 +627,18 @@ def create_alert_rule(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ): 
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Server not found or you do not have permission to access it."
         )
  
-    existing_rule = db.query(models.AlertRule).filter(
-        models.AlertRule.server_id == server_id,
-        models.AlertRule.name == rule.name
-    ).first()
+    existing_rule = db.query(
+        db.query(models.AlertRule.id).filter(
+            models.AlertRule.server_id == server_id,
+            models.AlertRule.name == rule.name
+        ).exists()
+    ).scalar()
 
     if existing_rule:
         raise HTTPException(
@@ -445,8 +660,7 @@ def get_alert_rules_for_server(
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(get_current_user)
 ): 
-    server = db.query(models.Server).filter(models.Server.id == server_id, models.Server.user_id == current_user.id).first()
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found or permission denied.")
     
     rules = db.query(models.AlertRule).filter(models.AlertRule.server_id == server_id).all()
@@ -458,14 +672,14 @@ def get_active_alert_count_for_server(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ): 
-    server = db.query(models.Server).filter(models.Server.id == server_id, models.Server.user_id == current_user.id).first()
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found or permission denied.")
  
-    count = db.query(models.Incident).filter(
+    # Served by the partial index idx_incidents_active_server.
+    count = db.query(func.count(models.Incident.id)).filter(
         models.Incident.server_id == server_id,
         models.Incident.resolved_at.is_(None)
-    ).count()
+    ).scalar()
     
     return count
 
@@ -484,10 +698,12 @@ def update_alert_rule(
     if db_rule.server.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to modify this rule")
 
-    existing_rule = db.query(models.AlertRule).filter( 
-        models.AlertRule.id != rule_id,
-        models.AlertRule.name == rule_update.name
-    ).first()
+    existing_rule = db.query(
+        db.query(models.AlertRule.id).filter(
+            models.AlertRule.id != rule_id,
+            models.AlertRule.name == rule_update.name
+        ).exists()
+    ).scalar()
 
     if existing_rule:
         raise HTTPException(
@@ -518,7 +734,8 @@ def delete_alert_rule(
     if db_rule.server.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this rule")
 
-    db.delete(db_rule)
+    # The rule's incidents go with it via ON DELETE CASCADE.
+    db.execute(delete(models.AlertRule).where(models.AlertRule.id == rule_id))
     db.commit()
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -526,17 +743,33 @@ def delete_alert_rule(
 app.include_router(alerts_router) 
 app.include_router(auth_router)
   
+# key_hash -> server_id for recently seen agent keys; a hit is a primary-key lookup only.
+_api_key_server_cache = TTLCache(maxsize=4096, ttl=300)
+_api_key_cache_lock = threading.Lock()
+
 def get_server_from_api_key(key: str = Security(api_key_header), db: Session = Depends(get_db)):
     if not key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API Key is missing")
      
-    key_hash = hashlib.sha256(key.encode()).hexdigest() 
-    api_key_entry = db.query(models.ApiKey).filter(models.ApiKey.key_hash == key_hash).first()
+    key_hash = security.hash_api_key(key)
+
+    with _api_key_cache_lock:
+        server_id = _api_key_server_cache.get(key_hash)
+    if server_id is not None:
+        server = db.get(models.Server, server_id)
+        if server:
+            return server
 
-    if not api_key_entry:
+    server = db.query(models.Server).join(
+        models.ApiKey, models.ApiKey.server_id == models.Server.id
+    ).filter(models.ApiKey.key_hash == key_hash).first()
+
+    if not server:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key")
-    
-    return api_key_entry.server
+
+    with _api_key_cache_lock:
+        _api_key_server_cache[key_hash] = server.id
+    return server
 
 # Configure the Gemini API
 try:
@@ -551,10 +784,39 @@ except Exception as e:
     print(f"Error configuring Gemini API: {e}")
     genai_model = None
 
+# In-process caches of Gemini answers, keyed by a digest of the prompt inputs.
+_right_sizing_cache = TTLCache(maxsize=1024, ttl=7 * 86400)
+_chat_cache = TTLCache(maxsize=256, ttl=300)
+_gemini_cache_lock = threading.Lock()
+
+def _gemini_cache_key(*parts: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+def _gemini_cache_get(cache: TTLCache, key: str) -> Optional[str]:
+    with _gemini_cache_lock:
+        return cache.get(key)
+
+def _gemini_cache_set(cache: TTLCache, key: str, value: str):
+    with _gemini_cache_lock:
+        cache[key] = value
+
+# Bounds on what a chat request can put into the Gemini prompt.
+CHAT_METRICS_MAX_ITEMS = 20
+CHAT_METRICS_PROMPT_BYTES = 4096
+
 class ChatRequest(BaseModel):
     question: str
     metrics: Dict[str, Any]
 
+    @field_validator("metrics")
+    @classmethod
+    def trim_metric_series(cls, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """Keeps only the last CHAT_METRICS_MAX_ITEMS entries of list values (datapoints, processes)."""
+        return {
+            key: value[-CHAT_METRICS_MAX_ITEMS:] if isinstance(value, list) else value
+            for key, value in metrics.items()
+        }
+
 @app.post("/api/v1/chat/diagnose", tags=["chat"])
 async def diagnose_with_chat(request: ChatRequest):
     if not genai_model:
@@ -563,12 +825,14 @@ async def diagnose_with_chat(request: ChatRequest):
             detail="AI Chat Service is not configured or available.",
         )
 
+    metrics_json = orjson.dumps(request.metrics)[:CHAT_METRICS_PROMPT_BYTES].decode(errors="ignore")
+
     # Construct the prompt for Gemini
     prompt = f"""
     You are an expert server administrator and performance analyst. Your goal is to help a user understand their server's health and diagnose problems based on the data provided.
 
     Here is a JSON object with the latest performance metrics from the user's server:
-    {request.metrics}
+    {metrics_json}
 
     The user has asked the following question:
     "{request.question}"
@@ -577,8 +841,14 @@ async def diagnose_with_chat(request: ChatRequest):
     If the metrics look healthy, say so.
     """
 
+    cache_key = _gemini_cache_key("chat", request.question, metrics_json)
+    cached_response = _gemini_cache_get(_chat_cache, cache_key)
+    if cached_response is not None:
+        return {"response": cached_response}
+
     try:
-        response = genai_model.generate_content(prompt)
+        response = await genai_model.generate_content_async(prompt)
+        _gemini_cache_set(_chat_cache, cache_key, response.text)
         return {"response": response.text}
     except Exception as e:
         raise HTTPException(
@@ -594,7 +864,7 @@ def agent_register(server_create: schemas.ServerCreate, db: Session = Depends(ge
     db.refresh(new_server)
 
     api_key_plain = secrets.token_hex(32)
-    api_key_hash = hashlib.sha256(api_key_plain.encode()).hexdigest()
+    api_key_hash = security.hash_api_key(api_key_plain)
     
     new_api_key = models.ApiKey(key_hash=api_key_hash, server_id=new_server.id)
     db.add(new_api_key)
@@ -611,8 +881,7 @@ def get_server_recommendations(
     current_user: models.User = Depends(get_current_user)
 ):
     """Get all recommendations for a server, most recent first."""
-    server = db.query(models.Server).filter(models.Server.id == server_id).first()
-    if not server or server.user_id != current_user.id:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found or permission denied.")
     
     return db.query(models.Recommendation).filter(
@@ -638,19 +907,10 @@ def claim_server(
 
 @server_router.put("/{server_id}", response_model=schemas.Server)
 def update_server_settings(
-    server_id: UUID,
     server_update: schemas.ServerUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    server: models.Server = Depends(owned_server),
+    db: Session = Depends(get_db)
 ):
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server:
-        raise HTTPException(status_code=404, detail="Server not found or permission denied.")
-
     # Update the server object with the new data
     update_data = server_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
@@ -661,23 +921,11 @@ def update_server_settings(
     return server
 
 @server_router.get("/{server_id}", response_model=schemas.Server)
-def get_server(
-    server_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
+def get_server(server: models.Server = Depends(owned_server)):
     """ 
     Get server details by ID. 
     Only the server owner can access this information.
     """
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server:
-        raise HTTPException(status_code=404, detail="Server not found or permission denied.")
-
     return server
 
 @server_router.get("/", response_model=List[schemas.Server])
@@ -701,15 +949,13 @@ def unregister_server(
     Unregister a server and delete all associated data.
     Only the server owner can perform this action.
     """
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server: 
-        return Response(status_code=status.HTTP_204_NO_CONTENT)
- 
-    db.delete(server)
+    # Child rows (metrics, logs, rules, incidents, ...) are removed by ON DELETE CASCADE in Postgres.
+    db.execute(
+        delete(models.Server).where(
+            models.Server.id == server_id,
+            models.Server.user_id == current_user.id
+        )
+    )
     db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -721,8 +967,7 @@ def get_server_incidents(
     current_user: models.User = Depends(get_current_user)
 ):
     # Add permission check to ensure user owns the server
-    server = db.query(models.Server).filter(models.Server.id == server_id, models.Server.user_id == current_user.id).first()
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found")
     
     return crud.get_incidents_for_server(db=db, server_id=server_id)
@@ -730,6 +975,7 @@ def get_server_incidents(
 @server_router.put("/incidents/{incident_id}/resolve", response_model=schemas.Incident)
 def resolve_incident(
     incident_id: UUID,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -740,62 +986,71 @@ def resolve_incident(
         models.Incident.id == incident_id
     ).first()
 
-    if not incident or incident.server.user_id != current_user.id:
+    # The rule's server is the incident's server, already loaded by the join above.
+    server = incident.alert_rule.server if incident else None
+    if not server or server.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Incident not found or permission denied.")
 
     if incident.status == 'resolved':
         return incident # Already resolved, do nothing
 
+    # Read everything the notifications need before commit expires the loaded objects.
+    rule_name = incident.alert_rule.name
+    hostname, webhook_url = server.hostname, server.webhook_url
+    webhook_format, webhook_headers = server.webhook_format, server.webhook_headers
+
     incident.status = 'resolved'
     incident.resolved_at = datetime.utcnow()
     db.commit()
     db.refresh(incident)
 
-    subject = f"ℹ️ Alert Manually Resolved: {incident.alert_rule.name}"
-    body = f"The alert '{incident.alert_rule.name}' on server '{incident.alert_rule.server.hostname}' was manually marked as resolved by {current_user.email}."
-    send_email_notification(current_user.email, subject, body)
-    if incident.alert_rule.server.webhook_url:
-        send_webhook_notification(
-            incident.alert_rule.server.webhook_url, 
-            incident.alert_rule.server.webhook_format, 
+    subject = f"ℹ️ Alert Manually Resolved: {rule_name}"
+    body = f"The alert '{rule_name}' on server '{hostname}' was manually marked as resolved by {current_user.email}."
+    # Deliver after the response is sent instead of holding the request open.
+    background_tasks.add_task(send_email_notification, current_user.email, subject, body)
+    if webhook_url:
+        background_tasks.add_task(
+            send_webhook_notification,
+            webhook_url, 
+            webhook_format, 
             subject, 
             body, 
             is_firing=False, 
-            headers=incident.alert_rule.server.webhook_headers
+            headers=webhook_headers
         )
 
     return incident
 
 app.include_router(server_router)
 
+def _fetch_incident_logs(server_id: UUID, start_time: datetime, end_time: datetime):
+    """Returns (level, message) rows of notable logs in the incident window, using its own session."""
+    db = SessionLocal()
+    try:
+        return db.query(models.Log.level, models.Log.message).filter(
+            models.Log.server_id == server_id,
+            models.Log.timestamp.between(start_time, end_time),
+            models.Log.level.in_(['ERROR', 'CRITICAL', 'FATAL', 'WARNING'])
+        ).limit(20).all()
+    finally:
+        db.close()
+
+# Process snapshots are large; only the most recent few are sent to the AI.
+INCIDENT_PROMPT_PROCESS_SAMPLES = 3
+
 def run_incident_analysis(incident_id: UUID):
     """
     This function runs in the background to analyze an incident.
     It gathers context, asks the AI for a summary, and updates the incident record.
     """
-
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        print("FATAL ERROR in run_incident_analysis: DATABASE_URL not set.")
-        return
-        
-    # For local development with the proxy, we need to use the correct driver
-    if "127.0.0.1" in db_url or "localhost" in db_url:
-        # Use psycopg2 when connecting via proxy, as pg8000 may have issues here.
-        # Ensure you have 'psycopg2-binary' installed.
-        db_url = db_url.replace("postgresql+pg8000", "postgresql+psycopg2")
-
     try:
-        engine = create_engine(db_url)
-        SessionLocal_BG = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        db = SessionLocal_BG()
+        db = SessionLocal()
     except Exception as e:
         print(f"FATAL ERROR creating DB session in background task: {e}")
         return
     
     try:
         incident = db.query(models.Incident).options(
-            joinedload(models.Incident.server),
             joinedload(models.Incident.alert_rule)
         ).filter(models.Incident.id == incident_id).first()
 
@@ -806,24 +1061,33 @@ def run_incident_analysis(incident_id: UUID):
         end_time = incident.triggered_at
         start_time = end_time - timedelta(minutes=5)
  
-        metric_records = db.query(models.Metric).filter(
-            models.Metric.server_id == incident.server_id,
-            models.Metric.timestamp.between(start_time, end_time)
-        ).order_by(models.Metric.timestamp.desc()).limit(10).all()
- 
-        log_records = db.query(models.Log).filter(
-            models.Log.server_id == incident.server_id,
-            models.Log.timestamp.between(start_time, end_time),
-            models.Log.level.in_(['ERROR', 'CRITICAL', 'FATAL', 'WARNING'])
-        ).limit(20).all()
+        # The two lookups are independent; fetch logs on a second connection meanwhile.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            logs_future = pool.submit(_fetch_incident_logs, incident.server_id, start_time, end_time)
+
+            # Only the two JSON columns the prompt uses, not full Metric entities.
+            metric_records = db.query(models.Metric.metrics, models.Metric.processes).filter(
+                models.Metric.server_id == incident.server_id,
+                models.Metric.timestamp.between(start_time, end_time)
+            ).order_by(models.Metric.timestamp.desc()).limit(10).all()
+
+            log_records = logs_future.result()
  
+        # metrics/processes come straight from JSON columns, so they need no further encoding.
+        recent_metrics = []
+        top_processes = []
+        for m in metric_records:
+            recent_metrics.append(m.metrics)
+            if m.processes and len(top_processes) < INCIDENT_PROMPT_PROCESS_SAMPLES:
+                top_processes.append(m.processes)
+
         correlated_data = {
             "alert_details": {
                 "name": incident.alert_rule.name,
                 "condition": f"{incident.alert_rule.metric} {incident.alert_rule.operator} {incident.alert_rule.threshold}% for {incident.alert_rule.duration_minutes} mins"
             },
-            "recent_metrics": [jsonable_encoder(m.metrics) for m in metric_records],
-            "top_processes": [jsonable_encoder(m.processes) for m in metric_records if m.processes],
+            "recent_metrics": recent_metrics,
+            "top_processes": top_processes,
             "relevant_logs": [{"level": log.level, "message": log.message} for log in log_records]
         }
         incident.correlated_data = correlated_data # Store for auditing
@@ -836,40 +1100,82 @@ def run_incident_analysis(incident_id: UUID):
         - Condition: {correlated_data['alert_details']['condition']}
 
         Recent Metrics (latest first):
-        {json.dumps(correlated_data['recent_metrics'], indent=2)}
+        {orjson.dumps(correlated_data['recent_metrics'], default=str).decode()}
 
         Top Processes at the time (latest first):
-        {json.dumps(correlated_data['top_processes'], indent=2)}
+        {orjson.dumps(correlated_data['top_processes'], default=str).decode()}
 
         Relevant Logs from the timeframe:
-        {json.dumps(correlated_data['relevant_logs'], indent=2)}
+        {orjson.dumps(correlated_data['relevant_logs'], default=str).decode()}
 
         Based on this data, provide a brief, one-paragraph summary of the likely root cause. Then, provide a short, scannable list of recommended actions. Be concise and direct.
         """
+
+        # Persist the audit data and hand the connection back to the pool before the
+        # seconds-long Gemini round trip.
+        db.commit()
+    except Exception as e:
+        print(f"FATAL ERROR in run_incident_analysis: {e}")
+        db.rollback()
+        return
+    finally:
+        db.close()
  
-        if genai_model:
-            try:
-                response = genai_model.generate_content(prompt)
-                incident.summary = response.text
-            except Exception as e:
-                incident.summary = f"AI analysis failed: {e}"
-        else:
-            incident.summary = "AI model not configured. Manual investigation required."
- 
-        incident.status = "active"
+    if genai_model:
+        try:
+            response = genai_model.generate_content(prompt, stream=True)
+            summary = "".join(chunk.text for chunk in response)
+        except Exception as e:
+            summary = f"AI analysis failed: {e}"
+    else:
+        summary = "AI model not configured. Manual investigation required."
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.Incident)
+            .where(models.Incident.id == incident_id)
+            .values(
+                summary=summary,
+                # only investigating -> active: the incident may have been resolved while Gemini was answering
+                status=case((models.Incident.status == "investigating", "active"), else_=models.Incident.status),
+            )
+        )
         db.commit()
         print(f"AI analysis complete for incident {incident_id}.")
-
     except Exception as e:
-        print(f"FATAL ERROR in run_incident_analysis: {e}")
+        print(f"FATAL ERROR saving analysis for incident {incident_id}: {e}")
         db.rollback()
     finally:
         db.close()
 
+def schedule_incident_analysis(incident_id: UUID):
+    """
+    Queues run_incident_analysis on the app's event loop (in a worker thread) and returns
+    immediately, so alert handlers don't wait on the Gemini call.
+    Falls back to running inline when the app loop isn't available.
+    """
+    if _main_loop is None or _main_loop.is_closed():
+        run_incident_analysis(incident_id)
+        return
+    asyncio.run_coroutine_threadsafe(asyncio.to_thread(run_incident_analysis, incident_id), _main_loop)
+
 # ========== METRICS ==========
 metrics_router = APIRouter(prefix="/api/v1/metrics", tags=["metrics"])
 
-@metrics_router.get("/history")
+_HISTORY_PERIODS = {
+    "15m": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+    "6h": timedelta(hours=6),
+    "24h": timedelta(hours=24),
+}
+
+# (server_id, period) -> encoded response body. Dashboards refresh the same history
+# repeatedly; 10s is below their refresh granularity, so expiry is the only invalidation.
+_history_response_cache = TTLCache(maxsize=1024, ttl=10)
+_history_cache_lock = threading.Lock()
+
+@metrics_router.get("/history", response_class=ORJSONResponse)
 def historical_metrics(
     server_id: str = Query(...),
     period: str = Query("1h", description="Time period, e.g., 15m, 1h, 6h, 24h"),
@@ -881,86 +1187,65 @@ def historical_metrics(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid server_id")
 
-    server = db.query(models.Server).filter(models.Server.id == server_uuid).first()
-    if not server or server.user_id != current_user.id:
+    if not _user_owns_server(db, server_uuid, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found or permission denied.")
  
-    period_map = {
-        "15m": timedelta(minutes=15),
-        "1h": timedelta(hours=1),
-        "6h": timedelta(hours=6),
-        "24h": timedelta(hours=24),
-    }
-
-    delta = period_map.get(period)
+    delta = _HISTORY_PERIODS.get(period)
     if not delta:
         raise HTTPException(status_code=400, detail="Invalid period specified")
 
+    cache_key = (server_uuid, period)
+    with _history_cache_lock:
+        body = _history_response_cache.get(cache_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
     start_time = datetime.utcnow() - delta
 
+    # Only the columns the response needs, streamed in chunks rather than as full ORM objects.
     rows = (
-        db.query(models.Metric)
+        db.query(
+            models.Metric.server_id,
+            models.Metric.timestamp,
+            models.Metric.processes,
+            models.Metric.metrics,
+            models.Metric.meta,
+        )
         .filter(models.Metric.server_id == server_uuid, models.Metric.timestamp >= start_time)
         .order_by(models.Metric.timestamp)
-        .all()
+        .yield_per(500)
     )
 
+    # Encoded straight to bytes so FastAPI skips jsonable_encoder; orjson handles UUID/datetime itself.
     results = [
         {
-            "server_id": str(row.server_id),
-            "timestamp": row.timestamp.isoformat(),
+            "server_id": row.server_id,
+            "timestamp": row.timestamp,
             "processes": row.processes or [],
             "metrics": row.metrics,
             "meta": row.meta or {},
         }
         for row in rows
     ]
-    
-    return results
+    body = orjson.dumps(results)
+
+    with _history_cache_lock:
+        _history_response_cache[cache_key] = body
+    return Response(content=body, media_type="application/json")
  
 @app.websocket("/api/v1/ws/metrics")
 async def ws_metrics(websocket: WebSocket, server_id: str = Query(...), token: Optional[str] = Query(None)):
 
     await websocket.accept()
 
-    subscriber = pubsub_v1.SubscriberClient()
-    subscription_name = f"ws-metrics-sub-{secrets.token_hex(8)}"
-    subscription_path = subscriber.subscription_path(PROJECT_ID, subscription_name)
-    topic_path = publisher.topic_path(PROJECT_ID, "metrics-broadcast")
-    filter_string = f'attributes.server_id = "{server_id}"'
-
-    try: 
-        await asyncio.to_thread(
-            subscriber.create_subscription,
-            request={
-                "name": subscription_path,
-                "topic": topic_path,
-                "expiration_policy": {"ttl": "86400s"},
-                "filter": filter_string,
-            }
-        )
-    except Exception as e:
-        print(f"Could not create subscription (it might already exist): {e}")
-
-    queue = asyncio.Queue()
-
-    def sync_callback(message: pubsub_v1.subscriber.message.Message):
-        try:
-            data = json.loads(message.data.decode("utf-8"))
-            queue.put_nowait(data)
-            message.ack()
-        except Exception as e:
-            print(f"Error in sync_callback: {e}")
-            message.nack()
-
-    streaming_pull_future = await asyncio.to_thread(subscriber.subscribe, subscription_path, callback=sync_callback)
-    print(f"[{server_id}] Subscribed to {subscription_path} and listening...")
+    queue = await metrics_hub.subscribe(server_id)
 
     async def forward_to_websocket():
         while True:
             try:
-                data = await queue.get()
-                await websocket.send_json(data)
+                # already JSON text from the publisher; no decode/re-encode per subscriber
+                text = await queue.get()
+                await websocket.send_text(text)
                 queue.task_done()
             except asyncio.CancelledError:
                 print(f"[{server_id}] Forwarder task cancelled.")
@@ -990,80 +1275,88 @@ async def ws_metrics(websocket: WebSocket, server_id: str = Query(...), token: O
     finally:
         print(f"[{server_id}] Cleaning up resources...")
         forwarder_task.cancel()
-        streaming_pull_future.cancel() 
-         
-        try:
-            await asyncio.to_thread(subscriber.delete_subscription, request={"subscription": subscription_path})
-        except Exception as e:
-            print(f"[{server_id}] Error deleting subscription: {e}")
-            
+        await metrics_hub.unsubscribe(server_id, queue)
         print(f"[{server_id}] Cleanup complete.")
 
+# Agent metric name -> AlertRule.metric for the metrics that get an anomaly check on ingest.
+_ANOMALY_RULE_METRICS = {
+    "cpu.percent": "cpu",
+    "mem.percent": "memory",
+}
+
+# Agent batches are parsed and validated straight from the request bytes by pydantic-core,
+# skipping FastAPI's stdlib json.loads + validate_python round.
+_METRIC_BATCH_ADAPTER = TypeAdapter(List[schemas.MetricIn])
+
+def _insert_and_commit(db: Session, model, rows: List[Dict[str, Any]]):
+    # The bulk INSERT/COPY and its commit, run together in a worker thread (never on the event loop).
+    crud.bulk_insert_rows(db, model, rows)
+    db.commit()
+
 @metrics_router.post("/")
 async def post_metrics(
-    payload: List[schemas.MetricIn],
+    request: Request,
     background_tasks: BackgroundTasks,
     server_uuid: models.Server = Depends(get_server_from_api_key),
     db: Session = Depends(get_db),
 ):
+    try:
+        payload = _METRIC_BATCH_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
     accepted = 0
 
     db_metrics_to_add = []
     anomaly_checks_info = []
+    messages_to_publish = []
 
     for item in payload:
-        if str(item.server_id) != str(server_uuid.id):
+        if item.server_id != server_uuid.id:
             raise HTTPException(status_code=403, detail="server_id mismatch")
 
-        metrics_json = [
-            m if isinstance(m, dict) else m.model_dump() if hasattr(m, "model_dump") else m.dict()
-            for m in item.metrics
-        ]
-
-        metrics_processes_json = [
-            p if isinstance(p, dict) else p.model_dump() if hasattr(p, "model_dump") else p.dict()
-            for p in (item.processes or [])
-        ]
-
-        db_metric = models.Metric(
-            server_id=item.server_id,
-            timestamp=item.timestamp,
-            metrics=metrics_json,
-            processes=metrics_processes_json,
-            meta=item.meta or {},
-        )
-        db_metrics_to_add.append(db_metric)
+        # MetricIn declares these as lists of plain dicts, so they are already JSON-ready.
+        metrics_json = item.metrics
+        metrics_processes_json = item.processes or []
+
+        db_metrics_to_add.append({
+            "server_id": item.server_id,
+            "timestamp": item.timestamp,
+            "metrics": metrics_json,
+            "processes": metrics_processes_json,
+            "meta": item.meta or {},
+        })
 
         for metric in metrics_json:
             name = metric.get("name")
             value = metric.get("value")
-            if name in ["cpu.percent", "mem.percent"] and value is not None:
+            if name in _ANOMALY_RULE_METRICS and value is not None:
                 anomaly_checks_info.append({
                     "server_id": item.server_id,
                     "metric_name": name,
                     "metric_value": value,
                 })
 
-        data_to_publish = {
+        messages_to_publish.append({
             "type": "metric",
-            "data": jsonable_encoder({
-                "server_id": str(item.server_id),
-                "timestamp": item.timestamp.isoformat(),
+            "data": {
+                "server_id": item.server_id,
+                "timestamp": item.timestamp,
                 "metrics": metrics_json,
                 "processes": metrics_processes_json,
                 "meta": item.meta or {},
-            })
-        }
-        
-        await asyncio.to_thread(
-            publisher.publish,
-            topic_path,
-            data=json.dumps(data_to_publish).encode("utf-8"),
-            server_id=str(item.server_id)
-        )
+            }
+        })
 
-    db.add_all(db_metrics_to_add)
-    await asyncio.to_thread(db.commit) 
+    # Encode the whole batch in a worker thread so large payloads don't stall the event loop.
+    # orjson encodes the UUID and datetime natively and returns bytes.
+    encoded_messages = await asyncio.to_thread(lambda: [orjson.dumps(message) for message in messages_to_publish])
+    server_id_attribute = str(server_uuid.id)
+    for data in encoded_messages:
+        publisher.publish(topic_path, data=data, server_id=server_id_attribute).add_done_callback(_log_publish_failure)
+
+    if db_metrics_to_add:
+        await asyncio.to_thread(_insert_and_commit, db, models.Metric, db_metrics_to_add)
 
     for check_info in anomaly_checks_info:
         background_tasks.add_task(
@@ -1087,7 +1380,11 @@ def get_baselines(
     metric: str = "cpu.percent",
     db: Session = Depends(get_db)
 ):
-    baselines = db.query(models.MetricBaseline).filter(
+    baselines = db.query(
+        models.MetricBaseline.hour_of_day,
+        models.MetricBaseline.mean_value,
+        models.MetricBaseline.std_dev_value,
+    ).filter(
         models.MetricBaseline.server_id == server_id,
         models.MetricBaseline.metric_name == metric
     ).order_by(models.MetricBaseline.hour_of_day).all()
@@ -1103,7 +1400,9 @@ def get_baselines(
 app.include_router(metrics_router)
  
 def _check_anomaly_and_alert_in_background(server_id, metric_name, metric_value):
-    db: Session = SessionLocal()
+    # The rule, server and owner loaded up front are still read after the commits below (notifications);
+    # without expiry those reads don't each cost a refresh SELECT.
+    db: Session = SessionLocal(expire_on_commit=False)
     try: 
         hour = datetime.utcnow().hour
         baseline = db.query(models.MetricBaseline).filter_by(
@@ -1114,14 +1413,11 @@ def _check_anomaly_and_alert_in_background(server_id, metric_name, metric_value)
         if not baseline or baseline.std_dev_value == 0:
             return
 
-        metric_map = {
-            "cpu.percent": "cpu",
-            "mem.percent": "memory",
-            "disk": "disk"
-        }
-        alert_metric = metric_map.get(metric_name, metric_name)
+        alert_metric = _ANOMALY_RULE_METRICS.get(metric_name, metric_name)
         
-        alert_rule = db.query(models.AlertRule).filter_by(
+        alert_rule = db.query(models.AlertRule).options(
+            joinedload(models.AlertRule.server).joinedload(models.Server.owner)
+        ).filter_by(
             server_id=server_id,
             metric=alert_metric,
             type=models.AlertRuleType.ANOMALY,
@@ -1155,7 +1451,7 @@ def _check_anomaly_and_alert_in_background(server_id, metric_name, metric_value)
             subject = f"🚨 Anomaly Detected: {metric_name} on {alert_rule.server.hostname}"
             body = f"Anomaly detected for {metric_name} on server '{alert_rule.server.hostname}'.\n\nValue: {metric_value:.2f}\nExpected: {baseline.mean_value:.2f} ± {baseline.std_dev_value:.2f}\n\nAn incident has been created and is being analyzed."
 
-            run_incident_analysis(incident.id)
+            schedule_incident_analysis(incident.id)
             send_email_notification(alert_rule.server.owner.email, subject, body)
             if alert_rule.server.webhook_url and alert_rule.server.webhook_format:
                 send_webhook_notification(
@@ -1167,16 +1463,17 @@ def _check_anomaly_and_alert_in_background(server_id, metric_name, metric_value)
                     alert_rule.server.webhook_headers
                 )
         elif not is_anomaly:
-            active_incident = db.query(models.Incident).filter(
-                models.Incident.alert_rule_id == alert_rule.id,
-                models.Incident.status == "active",
-                models.Incident.resolved_at.is_(None)
-            ).first()
-            if active_incident:
-                active_incident.status = "resolved"
-                active_incident.resolved_at = now
-                db.commit()  
-
+            resolved = db.execute(
+                update(models.Incident)
+                .where(
+                    models.Incident.alert_rule_id == alert_rule.id,
+                    models.Incident.status == "active",
+                    models.Incident.resolved_at.is_(None)
+                )
+                .values(status="resolved", resolved_at=now)
+            ).rowcount
+            db.commit()
+            if resolved:
                 subject = f"✅ Anomaly Resolved: {metric_name} on {alert_rule.server.hostname}"
                 body = f"The anomaly for {metric_name} on server '{alert_rule.server.hostname}' has resolved.\n\nValue: {metric_value:.2f}\nExpected: {baseline.mean_value:.2f} ± {baseline.std_dev_value:.2f}\n\nThe system has returned to normal."
                 send_email_notification(alert_rule.server.owner.email, subject, body)
@@ -1192,72 +1489,132 @@ def _check_anomaly_and_alert_in_background(server_id, metric_name, metric_value)
     finally:
         db.close()
 
+# SQL expressions extracting a rule's metric value from a metrics row (NULL when absent)
+_ALERT_METRIC_VALUE_SQL = {
+    models.AlertMetric.CPU: """
+        (SELECT CAST(elem ->> 'value' AS float)
+         FROM jsonb_array_elements(metrics.metrics) AS elem
+         WHERE elem ->> 'name' = 'cpu.percent' LIMIT 1)
+    """,
+    models.AlertMetric.MEMORY: """
+        (SELECT CAST(elem ->> 'value' AS float)
+         FROM jsonb_array_elements(metrics.metrics) AS elem
+         WHERE elem ->> 'name' = 'mem.percent' LIMIT 1)
+    """,
+    models.AlertMetric.DISK: """
+        (SELECT CAST(disk ->> 'percent' AS float)
+         FROM jsonb_array_elements(metrics.metrics) AS elem,
+              jsonb_array_elements(
+                  CASE WHEN jsonb_typeof(elem -> 'value') = 'array' THEN elem -> 'value' ELSE '[]'::jsonb END
+              ) AS disk
+         WHERE elem ->> 'name' = 'disk' AND disk ->> 'mountpoint' = '/' LIMIT 1)
+    """,
+}
+
+_ALERT_OPERATOR_SQL = {
+    models.AlertOperator.GREATER_THAN: ">",
+    models.AlertOperator.LESS_THAN: "<",
+}
+
+def _threshold_rule_violations(db: Session, rules: List[models.AlertRule], server_id) -> Dict[int, Optional[bool]]:
+    """
+    Evaluates every rule of a server in one round trip. The metric window is scanned once
+    (as far back as the longest rule) and each rule counts its own slice of it.
+    Maps rule id to True if every sample in the rule's window breaches it, False if any
+    does not (or lacks the metric), and None when the window doesn't hold enough samples
+    to judge yet.
+    """
+    if not rules:
+        return {}
+
+    now = datetime.utcnow()
+    params = {
+        "server_id": str(server_id),
+        "window_start": now - timedelta(minutes=max(rule.duration_minutes for rule in rules)),
+    }
+    per_rule_sql = []
+    for i, rule in enumerate(rules):
+        params[f"rule_id_{i}"] = rule.id
+        params[f"start_time_{i}"] = now - timedelta(minutes=rule.duration_minutes)
+        params[f"threshold_{i}"] = rule.threshold
+        per_rule_sql.append(f"""
+            SELECT CAST(:rule_id_{i} AS integer) AS rule_id,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE samples.{rule.metric.value} {_ALERT_OPERATOR_SQL[rule.operator]} :threshold_{i}) AS violating
+            FROM samples
+            WHERE samples.timestamp >= :start_time_{i}
+        """)
+
+    rows = db.execute(
+        text(f"""
+            WITH samples AS MATERIALIZED (
+                SELECT metrics.timestamp,
+                       {_ALERT_METRIC_VALUE_SQL[models.AlertMetric.CPU]} AS {models.AlertMetric.CPU.value},
+                       {_ALERT_METRIC_VALUE_SQL[models.AlertMetric.MEMORY]} AS {models.AlertMetric.MEMORY.value},
+                       {_ALERT_METRIC_VALUE_SQL[models.AlertMetric.DISK]} AS {models.AlertMetric.DISK.value}
+                FROM metrics
+                WHERE metrics.server_id = :server_id AND metrics.timestamp >= :window_start
+            )
+            {" UNION ALL ".join(per_rule_sql)}
+        """),
+        params,
+    ).all()
+
+    rules_by_id = {rule.id: rule for rule in rules}
+    violations = {}
+    for row in rows:
+        # Agents report several samples a minute; fewer than one per minute means the
+        # server hasn't been observed for the rule's full duration yet.
+        if row.total < max(rules_by_id[row.rule_id].duration_minutes, 1):
+            violations[row.rule_id] = None
+        else:
+            violations[row.rule_id] = row.violating == row.total
+    return violations
+
 def _evaluate_alerts_for_server_in_background(server_id):
-    db: Session = SessionLocal()
+    # The rule, server and owner loaded up front are still read after the commits below (notifications);
+    # without expiry those reads don't each cost a refresh SELECT.
+    db: Session = SessionLocal(expire_on_commit=False)
     try: 
-        server = db.query(models.Server).filter(models.Server.id == server_id).first()
-        if not server or not server.user_id:
-            return
-
-        rules = db.query(models.AlertRule).filter(
+        # Rules first: most ingest calls are for servers without threshold rules, which
+        # then cost this one query. The server and owner ride along on the same query.
+        rules = db.query(models.AlertRule).options(
+            joinedload(models.AlertRule.server).joinedload(models.Server.owner)
+        ).filter(
             models.AlertRule.server_id == server_id,
             models.AlertRule.type == models.AlertRuleType.THRESHOLD,
             models.AlertRule.is_enabled == True
         ).all()
 
-        for rule in rules:
-            start_time = datetime.utcnow() - timedelta(minutes=rule.duration_minutes)
-            
-            recent_metrics = db.query(models.Metric).filter(
-                models.Metric.server_id == server_id,
-                models.Metric.timestamp >= start_time
-            ).order_by(desc(models.Metric.timestamp)).all()
-
-            if len(recent_metrics) == 0:
-                continue  
-
-            is_violated = True
-            for metric_record in recent_metrics:
-                metric_value = None
-                
-                if rule.metric == 'cpu':
-                    metric_value = next((m.get('value') for m in metric_record.metrics if m.get('name') == 'cpu.percent'), None)
-                elif rule.metric == 'memory':
-                    metric_value = next((m.get('value') for m in metric_record.metrics if m.get('name') == 'mem.percent'), None)
-                elif rule.metric == 'disk':
-                    disk_metrics = next((m.get('value') for m in metric_record.metrics if m.get('name') == 'disk'), None)
-                    if disk_metrics and isinstance(disk_metrics, list):
-                        root_disk = next((d for d in disk_metrics if d.get('mountpoint') == '/'), None)
-                        if root_disk:
-                            metric_value = root_disk.get('percent')
-
-                if metric_value is None:
-                    is_violated = False
-                    break
-                
-                if rule.operator == '>' and not (metric_value > rule.threshold):
-                    is_violated = False
-                    break
-                if rule.operator == '<' and not (metric_value < rule.threshold):
-                    is_violated = False
-                    break
+        if not rules:
+            return
 
-            active_event = (
-                db.query(models.Incident)
-                .join(models.AlertRule, models.Incident.alert_rule_id == models.AlertRule.id) 
-                .filter(
-                    models.Incident.alert_rule_id == rule.id,
-                    models.AlertRule.type == models.AlertRuleType.THRESHOLD,
-                    models.Incident.resolved_at.is_(None)
-                ).first()
+        server = rules[0].server
+        if not server.user_id:
+            return
+
+        violations = _threshold_rule_violations(db, rules, server_id)
+        # rules were already filtered to THRESHOLD, so no join back to alert_rules is needed
+        rules_with_active_incident = {
+            alert_rule_id for (alert_rule_id,) in db.query(models.Incident.alert_rule_id).filter(
+                models.Incident.alert_rule_id.in_([rule.id for rule in rules]),
+                models.Incident.resolved_at.is_(None)
             )
+        }
+
+        for rule in rules:
+            is_violated = violations.get(rule.id)
+            if is_violated is None:
+                continue
+
+            active_event = rule.id in rules_with_active_incident
 
             if is_violated and not active_event: 
                 print(f"TRIGGERING alert for rule '{rule.name}' on server '{server.hostname}'")
                   
                 new_incident = crud.create_incident(db=db, server_id=server.id, alert_rule_id=rule.id)
      
-                run_incident_analysis(new_incident.id)  
+                schedule_incident_analysis(new_incident.id)
                 subject = f"🚨 Alert Firing: {rule.name} on {server.hostname}"
                 body = f"The alert '{rule.name}' is now firing.\n\nCondition: {rule.metric} {rule.operator} {rule.threshold}%\nServer: {server.hostname}\n\nThis condition has been met for over {rule.duration_minutes} minutes.\n\nAn incident has been created and is being analyzed."
                 send_email_notification(server.owner.email, subject, body)
@@ -1267,17 +1624,14 @@ def _evaluate_alerts_for_server_in_background(server_id):
             elif not is_violated and active_event: 
                 print(f"RESOLVING alert for rule '{rule.name}' on server '{server.hostname}'")
              
-                active_event.resolved_at = datetime.utcnow()
-
-                incident_to_resolve = db.query(models.Incident).filter(
-                    models.Incident.alert_rule_id == rule.id,
-                    models.Incident.status != 'resolved'
-                ).order_by(desc(models.Incident.triggered_at)).first()
-
-                if incident_to_resolve:
-                    incident_to_resolve.status = 'resolved'
-                    incident_to_resolve.resolved_at = datetime.utcnow()
-
+                db.execute(
+                    update(models.Incident)
+                    .where(
+                        models.Incident.alert_rule_id == rule.id,
+                        models.Incident.resolved_at.is_(None)
+                    )
+                    .values(status='resolved', resolved_at=datetime.utcnow())
+                )
                 db.commit() 
              
                 subject = f"✅ Alert Resolved: {rule.name} on {server.hostname}"
@@ -1320,12 +1674,7 @@ def _authenticate_websocket_user(token: str, server_id: str):
         if not user:
             raise Exception("User not found")
 
-        server = db.query(models.Server).filter(
-            models.Server.id == server_id,
-            models.Server.user_id == user.id
-        ).first()
-
-        if not server:
+        if not _user_owns_server(db, server_id, user.id):
             raise Exception("Server not found or access denied")
         return user
     except Exception as e:
@@ -1334,34 +1683,38 @@ def _authenticate_websocket_user(token: str, server_id: str):
     finally:
         db.close()
 
-@app.get("/api/v1/logs/{server_id}")
+@app.get("/api/v1/logs/{server_id}", response_class=ORJSONResponse)
 def recent_logs(
     server_id: UUID,
     limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(status_code=404, detail="Server not found or permission denied.")
  
-    rows = (
-        db.query(models.Log)
-        .filter(models.Log.server_id == server.id)
+    # The newest `limit` rows, handed back oldest first by Postgres.
+    latest = (
+        db.query(
+            models.Log.id,
+            models.Log.timestamp,
+            models.Log.level,
+            models.Log.source,
+            models.Log.event_id,
+            models.Log.message,
+            models.Log.meta,
+        )
+        .filter(models.Log.server_id == server_id)
         .order_by(desc(models.Log.timestamp))
         .limit(limit)
-        .all()
+        .subquery()
     )
+    rows = db.query(latest).order_by(latest.c.timestamp).all()
 
-    rows = list(reversed(rows))
-    return [
+    return ORJSONResponse(content=[
         {
             "id": r.id,
-            "time": r.timestamp.isoformat(),
+            "time": r.timestamp,
             "level": r.level,
             "source": r.source,
             "event_id": r.event_id,
@@ -1369,7 +1722,7 @@ def recent_logs(
             "meta": r.meta or {}
         }
         for r in rows
-    ]
+    ])
 
 @app.post("/api/v1/logs")
 async def post_logs(
@@ -1379,82 +1732,93 @@ async def post_logs(
 ):
     accepted = 0
     log_rows_to_add = []
+    log_events = []
+    has_subscribers = manager.has_subscribers(str(server_uuid.id))
 
     for item in payload:
-        if str(item.server_id) != str(server_uuid.id):
+        if item.server_id != server_uuid.id:
             raise HTTPException(status_code=403, detail="server_id mismatch")
 
-        log_row = models.Log(
-            server_id=item.server_id,
-            timestamp=item.timestamp,
-            level=item.level,
-            source=item.source,
-            event_id=item.event_id,
-            message=item.message,
-            meta=item.meta or {},
-        )
-        log_rows_to_add.append(log_row)
-
-        data = jsonable_encoder({
-            "time": item.timestamp.isoformat(),
+        log_rows_to_add.append({
+            "server_id": item.server_id,
+            "timestamp": item.timestamp,
             "level": item.level,
             "source": item.source,
             "event_id": item.event_id,
             "message": item.message,
-            "meta": item.meta or {}
+            "meta": item.meta or {},
         })
-        
-        await manager.broadcast(str(item.server_id), {"type": "logs", "data": [data]})
 
-    db.add_all(log_rows_to_add)
-    await asyncio.to_thread(db.commit) 
+        if has_subscribers:
+            log_events.append({
+                "time": item.timestamp,
+                "level": item.level,
+                "source": item.source,
+                "event_id": item.event_id,
+                "message": item.message,
+                "meta": item.meta or {}
+            })
+
+    if log_rows_to_add:
+        await asyncio.to_thread(_insert_and_commit, db, models.Log, log_rows_to_add)
+
+    # Every item belongs to the authenticated server, so one frame carries the whole batch.
+    if log_events:
+        await manager.broadcast(str(server_uuid.id), {"type": "logs", "data": log_events})
     
     accepted = len(log_rows_to_add)
     return {"accepted": accepted}
 
 apm_router = APIRouter(prefix="/api/v1/apm", tags=["APM"])
 
-def _save_trace_in_background(db_session_factory, trace_data: schemas.TraceIn, server_id: UUID):
+def _save_traces_in_background(db_session_factory, traces: List[schemas.TraceIn], server_id: UUID):
     db: Session = db_session_factory()
     try: 
-        db_trace = models.Trace(
-            server_id=server_id,
-            timestamp=trace_data.timestamp,
-            duration_ms=trace_data.duration_ms,
-            service_name=trace_data.service_name,
-            endpoint=trace_data.endpoint,
-            status_code=trace_data.status_code,
-            attributes=trace_data.attributes
-        )
-        db.add(db_trace)
-        db.flush() 
- 
-        sorted_spans_in = sorted(
-            trace_data.spans, 
-            key=lambda s: (0 if s.parent_id is None else 1, str(s.parent_id) if s.parent_id else '')
-        )
-
-        db_spans = []
-        for span_in in sorted_spans_in:
-            db_span = models.Span(
-                id=span_in.id,  
-                trace_id=db_trace.id,
-                parent_id=span_in.parent_id,
-                name=span_in.name,
-                span_type=span_in.span_type,
-                start_time=span_in.start_time,
-                duration_ms=span_in.duration_ms,
-                attributes=span_in.attributes
+        # Trace ids are generated here so the spans can reference them without flushing ORM objects first.
+        trace_ids = models.uuid7_batch(len(traces))
+        db.execute(insert(models.Trace), [
+            {
+                "id": trace_id,
+                "server_id": server_id,
+                "timestamp": trace_data.timestamp,
+                "duration_ms": trace_data.duration_ms,
+                "service_name": trace_data.service_name,
+                "endpoint": trace_data.endpoint,
+                "status_code": trace_data.status_code,
+                "attributes": trace_data.attributes,
+            }
+            for trace_id, trace_data in zip(trace_ids, traces)
+        ])
+
+        # Plain row mappings in one multi-row INSERT (COPY for big batches); spans are never read back here,
+        # so they skip the ORM unit of work.
+        span_rows = []
+        for trace_id, trace_data in zip(trace_ids, traces):
+            sorted_spans_in = sorted(
+                trace_data.spans, 
+                key=lambda s: (0 if s.parent_id is None else 1, str(s.parent_id) if s.parent_id else '')
+            )
+            span_rows.extend(
+                {
+                    "id": span_in.id,
+                    "trace_id": trace_id,
+                    "parent_id": span_in.parent_id,
+                    "name": span_in.name,
+                    "span_type": span_in.span_type,
+                    "start_time": span_in.start_time,
+                    "duration_ms": span_in.duration_ms,
+                    "attributes": span_in.attributes,
+                }
+                for span_in in sorted_spans_in
             )
-            db_spans.append(db_span)
         
-        if db_spans:
-            db.add_all(db_spans)
+        if span_rows:
+            crud.bulk_insert_rows(db, models.Span, span_rows)
         
         db.commit()
     except Exception as e:
         db.rollback()
-        print(f"Error saving APM trace to database: {e}") 
+        print(f"Error saving APM traces to database: {e}") 
         import traceback
         traceback.print_exc()
     finally:
@@ -1476,14 +1840,61 @@ async def post_apm_trace(
         raise HTTPException(status_code=403, detail="Server ID in payload does not match authorized server ID.")
   
     background_tasks.add_task(
-        _save_trace_in_background,
+        _save_traces_in_background,
         SessionLocal, 
-        trace_payload,
+        [trace_payload],
         server_id_query
     )
 
     return {"message": "APM trace data accepted for processing."}
 
+# Upper bound on a decompressed trace batch, so a small gzip body can't expand without limit.
+APM_BATCH_MAX_BYTES = 32 * 1024 * 1024
+
+def _gunzip_limited(body: bytes, limit: int) -> bytes:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # gzip container
+    data = decompressor.decompress(body, limit)
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Trace batch too large.")
+    return data
+
+@apm_router.post("/traces/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def post_apm_traces_bulk(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    server: models.Server = Depends(get_server_from_api_key)
+):
+    """
+    Ingests a batch of APM traces for one server (as flushed by the APM client); all of them
+    are stored with a single commit. The body may be gzip-compressed (Content-Encoding: gzip).
+    """
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = await asyncio.to_thread(_gunzip_limited, body, APM_BATCH_MAX_BYTES)
+        except zlib.error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body.")
+    try:
+        batch = schemas.TraceBatchIn.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    if any(trace.server_id != server.id for trace in batch.traces):
+        raise HTTPException(status_code=403, detail="Server ID in payload does not match authorized server ID.")
+
+    if batch.traces:
+        background_tasks.add_task(
+            _save_traces_in_background,
+            SessionLocal, 
+            batch.traces,
+            server.id
+        )
+
+    return {"message": f"{len(batch.traces)} APM traces accepted for processing."}
+
+# Built once; validates ORM rows and encodes them to JSON bytes in pydantic-core.
+_TRACE_LIST_ADAPTER = TypeAdapter(List[schemas.TraceOut])
+
 @apm_router.get("/traces/{server_id}", response_model=List[schemas.TraceOut])
 async def get_server_traces(
     server_id: UUID,
@@ -1496,25 +1907,23 @@ async def get_server_traces(
     Retrieves a list of recent application traces for a given server,
     including their top-level spans.
     """ 
-    server = db.query(models.Server).filter(
-        models.Server.id == server_id,
-        models.Server.user_id == current_user.id
-    ).first()
-
-    if not server:
+    if not _user_owns_server(db, server_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Server not found or you do not have permission to access it."
         )
      
     traces = db.query(models.Trace).options(
-        joinedload(models.Trace.spans).undefer_group('default') 
+        selectinload(models.Trace.spans).undefer_group('default') 
     ).filter(
         models.Trace.server_id == server_id
     ).order_by(
         models.Trace.timestamp.desc()
     ).offset(offset).limit(limit).all()
  
-    return traces
+    return Response(
+        content=_TRACE_LIST_ADAPTER.dump_json(_TRACE_LIST_ADAPTER.validate_python(traces, from_attributes=True)),
+        media_type="application/json",
+    )
  
 app.include_router(apm_router) 
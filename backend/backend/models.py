@@ -1,13 +1,35 @@
 import enum
 from sqlalchemy.ext.compiler import compiles
-from sqlalchemy import Column, FunctionElement, Integer, String, JSON, ForeignKey, DateTime, Text, func, Float, Boolean, Enum, Index, UniqueConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, FunctionElement, Integer, String, ForeignKey, DateTime, Text, func, Float, Boolean, Enum, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
+import os
+import time
 import uuid
 import datetime
 
 from .database import Base
 
+def uuid7() -> uuid.UUID:
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48-bit Unix millisecond timestamp, then random bits.
+    Used for the append-heavy telemetry tables so new primary keys land on the rightmost btree page
+    instead of a random one.
+    """
+    return _uuid7(time.time_ns() // 1_000_000, int.from_bytes(os.urandom(10), "big"))
+
+def uuid7_batch(count: int) -> list[uuid.UUID]:
+    """count uuid7() values from one clock read and one os.urandom call, for bulk inserts."""
+    unix_ms = time.time_ns() // 1_000_000
+    entropy = os.urandom(10 * count)
+    return [_uuid7(unix_ms, int.from_bytes(entropy[i:i + 10], "big")) for i in range(0, 10 * count, 10)]
+
+def _uuid7(unix_ms: int, rand: int) -> uuid.UUID:
+    value = (unix_ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76 | (rand >> 62 & 0xFFF) << 64   # version, rand_a
+    value |= 0b10 << 62 | rand & ((1 << 62) - 1)      # variant, rand_b
+    return uuid.UUID(int=value)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -24,30 +46,37 @@ class Server(Base):
     fingerprint = Column(String, unique=True, index=True)
     pubkey = Column(String)
     hostname = Column(String)
-    tags = Column(JSON)
+    tags = Column(JSONB)
     created_at = Column(DateTime(timezone=True), server_default=func.now()) 
 
     user_id = Column(Integer, ForeignKey("users.id"))
     webhook_url = Column(String, nullable=True)
     webhook_format = Column(String, nullable=True) # e.g., 'slack_discord' or 'teams'
-    webhook_headers = Column(JSON, nullable=True)
+    webhook_headers = Column(JSONB, nullable=True)
 
     owner = relationship("User", back_populates="servers") 
 
-    api_keys = relationship("ApiKey", back_populates="server", cascade="all, delete-orphan")
-    metrics = relationship("Metric", back_populates="server", cascade="all, delete-orphan")
-    logs = relationship("Log", back_populates="server", cascade="all, delete-orphan")
-    alert_rules = relationship("AlertRule", back_populates="server", cascade="all, delete-orphan")
-    incidents = relationship("Incident", back_populates="server", cascade="all, delete-orphan")
-    recommendations = relationship("Recommendation", back_populates="server", cascade="all, delete-orphan") # Add this line
+    api_keys = relationship("ApiKey", back_populates="server", cascade="all, delete-orphan", passive_deletes=True)
+    # Telemetry is insert-only and read with explicit queries; these collections never load.
+    metrics = relationship("Metric", back_populates="server", cascade="all, delete-orphan", passive_deletes=True, lazy="write_only")
+    logs = relationship("Log", back_populates="server", cascade="all, delete-orphan", passive_deletes=True, lazy="write_only")
+    alert_rules = relationship("AlertRule", back_populates="server", cascade="all, delete-orphan", passive_deletes=True)
+    incidents = relationship("Incident", back_populates="server", cascade="all, delete-orphan", passive_deletes=True)
+    recommendations = relationship("Recommendation", back_populates="server", cascade="all, delete-orphan", passive_deletes=True) # Add this line
 
 class time_bucket(FunctionElement):
     name = "time_bucket"
+    type = DateTime()
+    # The construct adds no state beyond its arguments, so statements using it can go in the
+    # compiled cache (without this SQLAlchemy warns and recompiles them on every execution).
+    inherit_cache = True
 
 @compiles(time_bucket, "postgresql")
 def pg_time_bucket(element, compiler, **kw):
-    # The first argument is the interval, the second is the timestamp column
-    return f"time_bucket('{compiler.process(element.clauses.clauses[0])}', {compiler.process(element.clauses.clauses[1])})"
+    # The first argument is the interval, the second is the timestamp column.
+    # The interval stays a bound parameter so every bucket width shares one cached statement.
+    interval, column = element.clauses.clauses
+    return f"time_bucket(CAST({compiler.process(interval, **kw)} AS INTERVAL), {compiler.process(column, **kw)})"
 
 class RecommendationType(str, enum.Enum):
     UPGRADE = "UPGRADE"
@@ -58,10 +87,11 @@ class Recommendation(Base):
     __tablename__ = "recommendations"
 
     id = Column(Integer, primary_key=True, index=True)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
     
     recommendation_type = Column(Enum(RecommendationType), nullable=False)
     summary = Column(Text, nullable=False)
+    stats = Column(JSONB, nullable=True) # avg/p95 CPU and memory, in 5% buckets, the recommendation was based on
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -71,7 +101,7 @@ class MetricBaseline(Base):
     __tablename__ = "metric_baselines"
 
     id = Column(Integer, primary_key=True, index=True)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
     metric_name = Column(String, nullable=False) # e.g., "cpu.percent", "mem.percent"
      
     hour_of_day = Column(Integer, nullable=False) 
@@ -104,44 +134,50 @@ class AlertRule(Base):
     __tablename__ = "alert_rules"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
     metric = Column(Enum(AlertMetric), nullable=False)
     operator = Column(Enum(AlertOperator), nullable=False)
     threshold = Column(Float, nullable=False)
     duration_minutes = Column(Integer, nullable=False, default=5) # e.g., must be over threshold for 5 mins
     is_enabled = Column(Boolean, default=True)
     
-    server = relationship("Server")
+    server = relationship("Server", back_populates="alert_rules")
     type = Column(Enum(AlertRuleType), default=AlertRuleType.THRESHOLD, nullable=False)
     
 class Incident(Base):
     __tablename__ = "incidents"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
-    alert_rule_id = Column(Integer, ForeignKey("alert_rules.id"), nullable=False) # Changed from UUID to Integer
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
+    alert_rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False) # Changed from UUID to Integer
     
-    status = Column(String, default="investigating", index=True) # investigating, active, resolved
+    status = Column(Enum("investigating", "active", "resolved", name="incident_status"), default="investigating", index=True) # native PG enum: 4 bytes per row and in the index
     triggered_at = Column(DateTime(timezone=True), server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
     
     summary = Column(Text, nullable=True)
-    correlated_data = Column(JSON, nullable=True) # Store the raw data fed to the AI for audit
+    correlated_data = Column(JSONB, nullable=True) # Store the raw data fed to the AI for audit
 
-    server = relationship("Server")
-    alert_rule = relationship("AlertRule")
+    server = relationship("Server", back_populates="incidents")
+    alert_rule = relationship("AlertRule", lazy="joined") # schemas.Incident always embeds the rule
+
+    __table_args__ = (
+        Index("idx_incidents_server_triggered_at", "server_id", triggered_at.desc()),
+        Index("idx_incidents_active_server", "server_id", postgresql_where=resolved_at.is_(None)),
+        Index("idx_incidents_active_rule", "alert_rule_id", postgresql_where=resolved_at.is_(None)),
+    )
            
 class Metric(Base):
     __tablename__ = "metrics"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"))
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"))
     timestamp = Column(DateTime(timezone=True))
-    metrics = Column(JSON)  # array of {name, value}
-    processes = Column(JSON)  # array of process info dicts
-    meta = Column(JSON)
+    metrics = Column(JSONB)  # array of {name, value}; JSONB so alert/baseline SQL reads it without re-parsing
+    processes = Column(JSONB)  # array of process info dicts
+    meta = Column(JSONB)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    server = relationship("Server", back_populates="metrics")
+    server = relationship("Server", back_populates="metrics", lazy="raise")
 
     __table_args__ = (
         Index("idx_metrics_server_timestamp", "server_id", "timestamp"),
@@ -150,38 +186,43 @@ class Metric(Base):
 class Log(Base):
     __tablename__ = "logs"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False, index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     level = Column(String, index=True)   # Info, Warning, Error
     source = Column(String, nullable=True)
     event_id = Column(String, nullable=True)
     message = Column(String, nullable=False)
-    meta = Column(JSON, nullable=True)
+    meta = Column(JSONB, nullable=True)
+
+    server = relationship("Server", back_populates="logs", lazy="raise")
 
-    server = relationship("Server", back_populates="logs")
+    __table_args__ = (
+        Index("idx_logs_server_timestamp", "server_id", timestamp.desc()),
+        Index("idx_logs_server_level_timestamp", "server_id", "level", "timestamp"), # notable-log lookups for incident analysis
+    )
 
 class ApiKey(Base):
     __tablename__ = "api_keys"
     id = Column(Integer, primary_key=True, index=True)
-    key_hash = Column(String, unique=True, index=True, nullable=False)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
-    server = relationship("Server")
+    key_hash = Column(LargeBinary(32), unique=True, index=True, nullable=False) # raw SHA-256 digest
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
+    server = relationship("Server", back_populates="api_keys")
 
 class Trace(Base):
     __tablename__ = "traces"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    server_id = Column(UUID(as_uuid=True), ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
     duration_ms = Column(Float, nullable=False) # Total duration of the trace in milliseconds
     service_name = Column(String, nullable=False) # e.g., "fastapi-app", "flask-service"
     endpoint = Column(String, nullable=True) # e.g., "/api/v1/users/{user_id}"
     status_code = Column(Integer, nullable=True) # HTTP status code for web requests
-    attributes = Column(JSON, nullable=True) # JSONB for additional trace-level metadata (e.g., host, user_id, request_id)
+    attributes = Column(JSONB, nullable=True) # additional trace-level metadata (e.g., host, user_id, request_id)
 
     server = relationship("Server")
-    spans = relationship("Span", back_populates="trace", cascade="all, delete-orphan", order_by="Span.start_time")
+    spans = relationship("Span", back_populates="trace", cascade="all, delete-orphan", passive_deletes=True, order_by="Span.start_time")
 
     def __repr__(self):
         return f"<Trace {self.id} on {self.server_id} - {self.endpoint} ({self.duration_ms:.2f}ms)>"
@@ -189,17 +230,17 @@ class Trace(Base):
 class Span(Base):
     __tablename__ = "spans"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    trace_id = Column(UUID(as_uuid=True), ForeignKey("traces.id"), nullable=False)
-    parent_id = Column(UUID(as_uuid=True), ForeignKey("spans.id"), nullable=True) # For nested spans
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    trace_id = Column(UUID(as_uuid=True), ForeignKey("traces.id", ondelete="CASCADE"), nullable=False)
+    parent_id = Column(UUID(as_uuid=True), ForeignKey("spans.id", ondelete="CASCADE"), nullable=True) # For nested spans
 
     name = Column(String, nullable=False) # e.g., "GET /users", "db.query", "calculate_payroll"
     span_type = Column(String, nullable=False) # e.g., "http", "db", "function", "external", "cache"
     start_time = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
     duration_ms = Column(Float, nullable=False)
-    attributes = Column(JSON, nullable=True) # JSONB for span-specific metadata (e.g., actual DB query, HTTP method, URL, error message)
+    attributes = Column(JSONB, nullable=True) # span-specific metadata (e.g., actual DB query, HTTP method, URL, error message)
 
-    trace = relationship("Trace", back_populates="spans")
+    trace = relationship("Trace", back_populates="spans", lazy="raise")
     parent = relationship("Span", remote_side=[id], backref="children", uselist=False)
 
     def __repr__(self):
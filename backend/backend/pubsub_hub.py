@@ -0,0 +1,118 @@
+import asyncio
+import secrets
+from typing import Dict, Optional, Set
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import pubsub_v1
+
+class MetricsSubscriptionHub:
+    """
+    Keeps a single process-wide Pub/Sub subscription (and one streaming pull) on the metrics
+    topic and demultiplexes messages by their server_id attribute into the asyncio queues of
+    the websockets watching that server. Watchers only register/unregister a queue; the
+    subscription is created for the first watcher and deleted on app shutdown. If the streaming
+    pull dies (gRPC error after retries, subscription expired/deleted), it is started again.
+    Queued items are the message's JSON text as published, ready to send as a text frame.
+    """
+    def __init__(self, project_id: str, topic_path: str):
+        self.project_id = project_id
+        self.topic_path = topic_path
+        self.subscriber = pubsub_v1.SubscriberClient()
+        # server_id -> queues of the websockets currently watching it
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+        self._subscription_path: Optional[str] = None
+        self._streaming_pull_future = None
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, server_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        async with self._lock:
+            if self._streaming_pull_future is None:
+                await self._start()
+            self._queues.setdefault(server_id, set()).add(queue)
+        return queue
+
+    async def unsubscribe(self, server_id: str, queue: asyncio.Queue):
+        async with self._lock:
+            queues = self._queues.get(server_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._queues[server_id]
+
+    async def close(self):
+        """Stops the streaming pull and deletes the subscription (used on app shutdown)."""
+        async with self._lock:
+            self._queues.clear()
+            if self._streaming_pull_future is None:
+                return
+            self._streaming_pull_future.cancel()
+            self._streaming_pull_future = None
+            try:
+                await asyncio.to_thread(self.subscriber.delete_subscription, request={"subscription": self._subscription_path})
+            except Exception as e:
+                print(f"Error deleting subscription {self._subscription_path}: {e}")
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        subscription_name = f"ws-metrics-sub-{secrets.token_hex(8)}"
+        self._subscription_path = self.subscriber.subscription_path(self.project_id, subscription_name)
+
+        try:
+            await asyncio.to_thread(
+                self.subscriber.create_subscription,
+                request={
+                    "name": self._subscription_path,
+                    "topic": self.topic_path,
+                    "expiration_policy": {"ttl": "86400s"},
+                }
+            )
+        except AlreadyExists:
+            print(f"Subscription {self._subscription_path} already exists; reusing it.")
+
+        def fan_out(server_id, text):
+            for queue in self._queues.get(server_id, ()):
+                queue.put_nowait(text)
+
+        # Runs on the Pub/Sub client's threads; hand the message text back to the event loop.
+        def sync_callback(message: pubsub_v1.subscriber.message.Message):
+            try:
+                server_id = message.attributes.get("server_id")
+                # nobody is watching this server; nothing to hand over
+                if server_id in self._queues:
+                    loop.call_soon_threadsafe(fan_out, server_id, message.data.decode())
+                message.ack()
+            except Exception as e:
+                print(f"Error in sync_callback: {e}")
+                message.nack()
+
+        # Runs on a Pub/Sub thread once the pull stops for good; every dashboard depends on it.
+        def on_pull_done(future):
+            if future.cancelled(): # close()
+                return
+            try:
+                error = future.exception()
+            except Exception as e:
+                error = e
+            print(f"Streaming pull on {self._subscription_path} stopped: {error}")
+            asyncio.run_coroutine_threadsafe(self._restart(future), loop)
+
+        self._streaming_pull_future = await asyncio.to_thread(
+            self.subscriber.subscribe, self._subscription_path, callback=sync_callback
+        )
+        self._streaming_pull_future.add_done_callback(on_pull_done)
+        print(f"Subscribed to {self._subscription_path} and listening...")
+
+    async def _restart(self, future):
+        async with self._lock:
+            if self._streaming_pull_future is not future: # closed, or already replaced
+                return
+            self._streaming_pull_future = None
+            if not self._queues:
+                return # the next subscribe starts a new pull
+            try:
+                await self._start()
+            except Exception as e:
+                # left unset, so the next subscribe tries again
+                self._streaming_pull_future = None
+                print(f"Error restarting the metrics subscription: {e}")
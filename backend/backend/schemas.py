@@ -57,8 +57,7 @@ class Incident(BaseModel):
     summary: Optional[str] = None
     alert_rule: AlertRule
 
-    class Config:
-        from_attributes = True 
+    model_config = ConfigDict(from_attributes=True)
 
 class RecommendationBase(BaseModel):
     recommendation_type: RecommendationType
@@ -72,8 +71,7 @@ class Recommendation(RecommendationBase):
     server_id: UUID
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
         
 class ServerCreate(BaseModel):
     hostname: str
@@ -150,8 +148,7 @@ class SpanIn(BaseModel):
     duration_ms: float
     attributes: Optional[Dict[str, Any]] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TraceIn(BaseModel):
     server_id: UUID 
@@ -163,9 +160,11 @@ class TraceIn(BaseModel):
     attributes: Optional[Dict[str, Any]] = None
     spans: List[SpanIn] = [] # Nested spans
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
  
+class TraceBatchIn(BaseModel):
+    traces: List[TraceIn] # batched by the APM client's background flusher
+
 class SpanOut(SpanIn):
     trace_id: UUID
 
@@ -1,6 +1,11 @@
+import hashlib
+import hmac
 import os
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
+from cachetools import TTLCache
 from passlib.context import CryptContext
 
 # Prefer PyJWT; fallback to python-jose if PyJWT isn't available
@@ -15,8 +20,34 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
 JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES"))  # 24h default
 
-# Add a password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Constant jwt.decode arguments, built once rather than per call.
+_JWT_ALGORITHMS = [JWT_ALGORITHM]
+_JWT_DECODE_OPTIONS = {
+    True: {"verify_exp": True} if _JWT_BACKEND == "pyjwt" else None,
+    False: {"verify_exp": False} if _JWT_BACKEND == "pyjwt" else None,
+}
+
+# Add a password hashing context. New hashes are argon2id; bcrypt hashes still verify and are
+# upgraded on the next successful login (see verify_and_update_password).
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__memory_cost=65536,
+    argon2__time_cost=3,
+    argon2__parallelism=4,
+)
+
+# token -> verified claims; websocket and polling clients present the same token many times a minute.
+_decoded_token_cache = TTLCache(maxsize=4096, ttl=30)
+_decoded_token_cache_lock = threading.Lock()
+
+# HMAC(stored hash | password) of recently verified logins, so repeat logins skip bcrypt.
+# Keyed with a per-process secret; only successes are cached so failed guesses always pay full cost,
+# and a password change alters the stored hash and therefore the key.
+_verified_password_cache = TTLCache(maxsize=1024, ttl=300)
+_verified_password_cache_lock = threading.Lock()
+_verified_password_key = os.urandom(32)
 
 
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
@@ -35,18 +66,63 @@ def decode_jwt(token: str, verify_exp: bool = True) -> dict:
     """Unified decoder returning the full claims dict.
     For PyJWT, options is supported; for python-jose, options is ignored.
     """
-    options = {"verify_exp": verify_exp} if _JWT_BACKEND == "pyjwt" else None
-    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options=options)
+    if verify_exp:
+        with _decoded_token_cache_lock:
+            payload = _decoded_token_cache.get(token)
+        if payload is not None and payload.get("exp", 0) > time.time():
+            return payload
+
+    payload = jwt.decode(token, JWT_SECRET, algorithms=_JWT_ALGORITHMS, options=_JWT_DECODE_OPTIONS[verify_exp])
+    if verify_exp and "exp" in payload:
+        with _decoded_token_cache_lock:
+            _decoded_token_cache[token] = payload
+    return payload
 
 
 def verify_access_token(token: str) -> str:
     """Returns subject (server_id) if valid, raises jwt exceptions otherwise."""
-    decoded = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-    return decoded.get("sub")
+    return decode_jwt(token).get("sub")
+
+
+def _password_cache_key(plain_password, hashed_password) -> bytes:
+    return hmac.new(_verified_password_key, f"{hashed_password}|{plain_password}".encode(), hashlib.sha256).digest()
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    cache_key = _password_cache_key(plain_password, hashed_password)
+    with _verified_password_cache_lock:
+        if cache_key in _verified_password_cache:
+            return True
+
+    verified = pwd_context.verify(plain_password, hashed_password)
+    if verified:
+        with _verified_password_cache_lock:
+            _verified_password_cache[cache_key] = True
+    return verified
+
+
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """
+    Like verify_password, but also returns a replacement hash when the stored one uses a deprecated
+    scheme (bcrypt) or outdated parameters; the caller should persist it. (True, None) otherwise.
+    """
+    with _verified_password_cache_lock:
+        if _password_cache_key(plain_password, hashed_password) in _verified_password_cache:
+            return True, None
+
+    verified, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    if verified:
+        with _verified_password_cache_lock:
+            _verified_password_cache[_password_cache_key(plain_password, new_hash or hashed_password)] = True
+    return verified, new_hash
+
+
+def hash_api_key(key: str) -> bytes:
+    """
+    Digest stored in (and looked up from) api_keys.key_hash. Agent keys are 256-bit random tokens,
+    so a plain SHA-256 is enough; a password KDF would only add per-request latency.
+    """
+    return hashlib.sha256(key.encode()).digest()
 
 
 def get_password_hash(password):
@@ -1,29 +1,35 @@
-from typing import Dict, List
+import asyncio
+import orjson
+from typing import Dict, Set
 from fastapi import WebSocket
 
 class ConnectionManager:
     def __init__(self):
-        # store list of websockets per server_id
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # store set of websockets per server_id (O(1) add/discard under reconnect churn)
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
 
     async def connect(self, server_id: str, websocket: WebSocket):
         await websocket.accept()
-        if server_id not in self.active_connections:
-            self.active_connections[server_id] = []
-        self.active_connections[server_id].append(websocket)
+        self.active_connections.setdefault(server_id, set()).add(websocket)
 
     async def disconnect(self, server_id: str, websocket: WebSocket):
         if server_id in self.active_connections:
-            self.active_connections[server_id].remove(websocket)
+            self.active_connections[server_id].discard(websocket)
             if not self.active_connections[server_id]:
                 del self.active_connections[server_id]
 
+    def has_subscribers(self, server_id: str) -> bool:
+        return server_id in self.active_connections
+
     async def broadcast(self, server_id: str, message: dict):
         """Send message to all connected websockets for this server_id"""
         if server_id in self.active_connections:
-            for websocket in self.active_connections[server_id]:
-                try:
-                    await websocket.send_json(message)
-                except Exception:
+            # encode once for every subscriber; orjson handles datetime/UUID values itself
+            text = orjson.dumps(message, default=str).decode()
+            websockets = tuple(self.active_connections[server_id])
+            # send to all subscribers concurrently so one slow client doesn't hold up the rest
+            results = await asyncio.gather(*(websocket.send_text(text) for websocket in websockets), return_exceptions=True)
+            for websocket, result in zip(websockets, results):
+                if isinstance(result, Exception):
                     # handle disconnected websockets
                     await self.disconnect(server_id, websocket)
@@ -1,4 +1,5 @@
 import os
+import re
 import time
 from uuid import UUID
 from dotenv import load_dotenv
@@ -46,11 +47,13 @@ else:
 app = FastAPI(title="Example App with Server Metrics APM", middleware=middleware_list)
  
 # --- Helper function that simulates work ---
+_ERROR_RE = re.compile("error", re.IGNORECASE) # compiled once; matches without a lowered copy of the input
+
 @trace_function(name="process_data_sync", span_type="internal")
 def _process_data_synchronously(data: str):
     """Simulates some synchronous data processing."""
     time.sleep(0.05) # Simulate work
-    if "error" in data.lower():
+    if _ERROR_RE.search(data):
         raise ValueError("Simulated processing error")
     return f"Processed: {data}"
 
@@ -4,10 +4,10 @@ from .client import APMClient
 
 _apm_client_instance: Optional[APMClient] = None
  
-def init_apm(backend_url: str, server_id: UUID, auth_token: str) -> APMClient:
+def init_apm(backend_url: str, server_id: UUID, auth_token: str, sample_rate: Optional[float] = None) -> APMClient:
     """Initializes the APM client globally for the application."""
     global _apm_client_instance
-    _apm_client_instance = APMClient(backend_url, server_id, auth_token)
+    _apm_client_instance = APMClient(backend_url, server_id, auth_token, sample_rate=sample_rate)
     print(f"APM client initialized for server {server_id} reporting to {backend_url}")
     return _apm_client_instance
  
@@ -21,7 +21,7 @@ def get_apm_client() -> Optional[APMClient]:
 
 # Expose specific items from submodules for convenience when doing 'from server_metrics_apm import X'
 from .instrument import trace_function, trace_http_request, trace_db_query
-from .utils import generate_uuid
+from .utils import generate_uuid, generate_span_id
 from .middleware import APMMiddleware
 
 # Also expose context functions via the package
@@ -29,7 +29,8 @@ from .context import ( # Import all context functions from the context submodule
     get_current_trace_id, set_current_trace_id,
     get_current_span_id, set_current_span_id,
     get_span_stack, set_span_stack,
+    get_trace_context, start_trace_context,
     reset_trace_context
 )
 
-__version__ = "0.1.0"
\ No newline at end of file
+__version__ = "0.2.0"
\ No newline at end of file
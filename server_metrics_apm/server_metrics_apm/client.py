@@ -1,31 +1,171 @@
+import atexit
+import gzip
+import os
+import queue
+import random
+import threading
+import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from uuid import UUID
- 
+
+from .utils import UtcTimestamp
+
 load_dotenv()
 
+# Only the bulk endpoint accepts gzip bodies, and only bodies above this size are compressed.
+GZIP_MIN_BYTES = 1024
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def _json_default(value):
+    if isinstance(value, UtcTimestamp):
+        return value.isoformat()
+    if isinstance(value, UUID): # orjson only takes exact uuid.UUID, not generate_uuid()'s subclass
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
 class APMClient:
-    def __init__(self, backend_url: str, server_id: UUID, auth_token: str):
+    """
+    Ships traces to the backend. send_trace only queues the trace; a daemon thread posts queued
+    traces together to the bulk endpoint once APM_MAX_BATCH_SIZE of them are waiting or
+    APM_BATCH_TIMEOUT_MS has passed since the first one, over a pooled keep-alive session.
+    Only a sample_rate fraction of root traces is recorded at all (see should_sample).
+    """
+    def __init__(self, backend_url: str, server_id: UUID, auth_token: str,
+                 max_batch_size: Optional[int] = None, batch_timeout_ms: Optional[int] = None,
+                 sample_rate: Optional[float] = None):
         self.backend_url = backend_url
         self.server_id = server_id
+        self.server_id_str = str(server_id) # sent with every trace
         self.auth_token = auth_token
+        self.service_name = urlparse(backend_url).hostname or "unknown-service" # reported on every trace
         self.traces_endpoint = f"{self.backend_url}/api/v1/apm/traces"
+        self.bulk_traces_endpoint = f"{self.backend_url}/api/v1/apm/traces/bulk"
+        # server_id and service_name are the same on every trace this client sends: encode them once
+        # and splice them in front of each queued trace that leaves them out (see _encode_trace).
+        self._trace_prefix = orjson.dumps({"server_id": self.server_id_str, "service_name": self.service_name})[:-1] + b","
+        self.max_batch_size = max_batch_size or int(os.getenv("APM_MAX_BATCH_SIZE", "128"))
+        self.batch_timeout = (batch_timeout_ms or int(os.getenv("APM_BATCH_TIMEOUT_MS", "250"))) / 1000
+        # Head sampling: the fraction of root traces recorded (APM_SAMPLE_RATE, default all of them).
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("APM_SAMPLE_RATE", "1.0"))
+        self._sample_threshold = int(min(max(self.sample_rate, 0.0), 1.0) * (1 << 32))
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # Bounded so a backend outage can't grow memory without limit; overflow is dropped and counted.
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=int(os.getenv("APM_MAX_QUEUE_SIZE", "10000")))
+        self.dropped_traces = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name="apm-trace-flusher", daemon=True)
+        self._flusher.start()
+        # the flusher is a daemon thread; don't drop whatever is still queued when the process exits
+        atexit.register(self.flush)
+
+    def should_sample(self) -> bool:
+        """Decides whether a new root trace is recorded; nested spans follow the root's decision."""
+        return self._sample_threshold >= 1 << 32 or random.getrandbits(32) < self._sample_threshold
 
     def send_trace(self, trace_data: Dict[str, Any]):
-        """Sends a single trace (with its spans) to the backend."""
+        """
+        Queues a single trace (with its spans); the background flusher sends it with the next batch.
+        server_id and service_name may be left out; the client's own are filled in when it's sent.
+        Never blocks the caller: when the queue is full the trace is dropped (see dropped_traces).
+        """
+        try:
+            self._queue.put_nowait(trace_data)
+        except queue.Full:
+            self.dropped_traces += 1
+            if self.dropped_traces % 1000 == 1:
+                print(f"WARNING: APM trace queue full; {self.dropped_traces} traces dropped so far.")
+
+    def send_trace_sync(self, trace_data: Dict[str, Any]):
+        """Sends a single trace (with its spans) to the backend right away."""
+        body = self._encode_trace(trace_data)
+        if body is not None:
+            # the single-trace endpoint still takes the server id as a query parameter
+            self._post(self.traces_endpoint, body, "APM Trace sent successfully.", params={"server_id": self.server_id_str})
+
+    def flush(self):
+        """Sends everything still queued, on the calling thread (e.g. at shutdown). Never raises."""
+        batch: List[Dict[str, Any]] = []
+        try:
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if len(batch) >= self.max_batch_size:
+                    self._send_batch(batch)
+                    batch = []
+            if batch:
+                self._send_batch(batch)
+        except Exception as e:
+            print(f"ERROR: APM trace flush failed: {e}")
+
+    def _flush_loop(self):
+        while True:
+            try:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.batch_timeout
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._send_batch(batch)
+            except Exception as e:
+                # the flusher must outlive any one bad batch, or the queue fills and every later trace is dropped
+                print(f"ERROR: APM trace flusher failed: {e}")
+
+    def _encode_trace(self, trace: Dict[str, Any]) -> Optional[bytes]:
+        """The trace's JSON, or None (logged) if it can't be serialized, e.g. an attribute of an unsupported type."""
+        try:
+            if "server_id" in trace or "service_name" in trace:
+                # the caller set its own; the client's values only fill in what's missing
+                trace = {"server_id": self.server_id_str, "service_name": self.service_name, **trace}
+                return orjson.dumps(trace, default=_json_default, option=_ORJSON_OPTIONS)
+            # orjson encodes straight to bytes (and handles UUID/datetime values) much faster than requests' json=
+            body = orjson.dumps(trace, default=_json_default, option=_ORJSON_OPTIONS)
+        except TypeError as e: # orjson.JSONEncodeError is a TypeError
+            print(f"ERROR: Dropping APM trace that can't be serialized: {e}")
+            return None
+        if body == b"{}":
+            return self._trace_prefix[:-1] + b"}"
+        return self._trace_prefix + body[1:]
+
+    def _send_batch(self, traces: List[Dict[str, Any]]):
+        encoded = [body for body in map(self._encode_trace, traces) if body is not None]
+        if not encoded:
+            return
+        body = b'{"traces":[' + b",".join(encoded) + b"]}"
+        self._post(self.bulk_traces_endpoint, body, f"APM batch of {len(encoded)} traces sent successfully.", compress=True)
+
+    def _post(self, endpoint: str, body: bytes, success_message: str, compress: bool = False,
+              params: Optional[Dict[str, str]] = None):
         headers = {
             "Content-Type": "application/json",
             "X-API-Key": self.auth_token
-        } 
-        trace_data["server_id"] = str(self.server_id) 
+        }
+        # Batches are repetitive JSON and shrink several-fold; tiny bodies aren't worth the CPU.
+        if compress and len(body) > GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
 
-        try: 
-            params = {"server_id": str(self.server_id)}
-            response = requests.post(self.traces_endpoint, headers=headers, params=params, json=trace_data, timeout=5)
+        try:
+            response = self._session.post(endpoint, headers=headers, params=params, data=body, timeout=5)
             response.raise_for_status()
-            print(f"APM Trace sent successfully. Status: {response.status_code}")
+            print(f"{success_message} Status: {response.status_code}")
         except requests.exceptions.RequestException as e:
             print(f"ERROR: Failed to send APM trace: {e}")
             if hasattr(e, 'response') and e.response is not None:
-                print(f"Response Content: {e.response.text}")
\ No newline at end of file
+                print(f"Response Content: {e.response.text}")
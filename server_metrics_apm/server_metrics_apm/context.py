@@ -2,36 +2,69 @@ import contextvars
 from typing import Optional, List, Dict, Any
 from uuid import UUID
 
-_current_trace_id_ctx = contextvars.ContextVar('current_trace_id', default=None)
+class TraceContext:
+    """
+    The trace in progress: its id and the spans finished so far. One object per trace, shared by
+    every task/thread the request fans out to, so nested spans land in the root's span list.
+    (The current span id is per task and lives in its own ContextVar, as the string that's sent.)
+    A trace_id of None marks a request the sampler skipped: nested spans see it and record nothing.
+    """
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: Optional[UUID]):
+        self.trace_id = trace_id
+        self.spans: List[Dict[str, Any]] = []
+
+_current_trace_ctx = contextvars.ContextVar('current_trace', default=None)
 _current_span_id_ctx = contextvars.ContextVar('current_span_id', default=None)
-_span_stack_ctx = contextvars.ContextVar('span_stack', default=[]) 
+
+def get_trace_context() -> Optional[TraceContext]:
+    """The current trace (id and span list) in a single lookup, or None outside a trace."""
+    return _current_trace_ctx.get()
+
+def start_trace_context(trace_id: Optional[UUID]) -> TraceContext:
+    """Begins a new trace in the current context and returns it (trace_id None: not sampled)."""
+    trace = TraceContext(trace_id)
+    _current_trace_ctx.set(trace)
+    _current_span_id_ctx.set(None)
+    return trace
 
 def get_current_trace_id() -> Optional[UUID]:
-    return _current_trace_id_ctx.get()
+    trace = _current_trace_ctx.get()
+    return trace.trace_id if trace is not None else None
 
 def set_current_trace_id(trace_id: Optional[UUID]):
-    _current_trace_id_ctx.set(trace_id)
+    _current_trace_ctx.set(TraceContext(trace_id) if trace_id is not None else None)
 
-def get_current_span_id() -> Optional[UUID]:
+def get_current_span_id() -> Optional[str]:
     return _current_span_id_ctx.get()
 
-def set_current_span_id(span_id: Optional[UUID]):
+def set_current_span_id(span_id: Optional[str]):
     _current_span_id_ctx.set(span_id)
 
 def get_span_stack() -> List[Dict[str, Any]]:
-    return _span_stack_ctx.get()
+    """
+    The current trace's live span list (appending to it records a span; no set_span_stack needed).
+    Outside a trace, a fresh empty list that isn't stored anywhere.
+    """
+    trace = _current_trace_ctx.get()
+    return trace.spans if trace is not None else []
 
 def set_span_stack(span_stack: List[Dict[str, Any]]):
-    _span_stack_ctx.set(span_stack)
+    trace = _current_trace_ctx.get()
+    if trace is not None:
+        trace.spans = span_stack
 
 def push_span_to_stack(span_data: Dict[str, Any]):
-    """Adds a completed span to the thread-local stack for the current trace."""
-    current_stack = _span_stack_ctx.get()
-    current_stack.append(span_data)
-    _span_stack_ctx.set(current_stack)
-    
+    """
+    Adds a completed span to the current trace's span list (no-op outside a trace).
+    Appends in place: one ContextVar read, no write.
+    """
+    trace = _current_trace_ctx.get()
+    if trace is not None:
+        trace.spans.append(span_data)
+
 def reset_trace_context():
     """Resets all contextvars for a new trace."""
-    _current_trace_id_ctx.set(None)
+    _current_trace_ctx.set(None)
     _current_span_id_ctx.set(None)
-    _span_stack_ctx.set([]) 
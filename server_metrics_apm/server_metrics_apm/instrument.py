@@ -1,96 +1,145 @@
 import functools
-from datetime import datetime
 from typing import Optional, Dict, Any
 import asyncio
 
-from server_metrics_apm import get_apm_client 
-from server_metrics_apm.context import ( 
-    get_current_trace_id, set_current_trace_id,
+from server_metrics_apm import get_apm_client
+from server_metrics_apm.context import (
+    get_trace_context, start_trace_context,
     get_current_span_id, set_current_span_id,
-    push_span_to_stack,
-    get_span_stack, 
     reset_trace_context
 )
 
-from .utils import generate_uuid, now_ms
-from urllib.parse import urlparse
-  
+from .utils import _NO_ATTRIBUTES, UtcTimestamp, generate_span_id, generate_uuid, monotonic_ns, now_ns
+
+class _Span:
+    """Bookkeeping for one in-flight span, between _start_span and _finish_span."""
+    __slots__ = ("client", "trace", "is_root", "span_id", "parent_span_id", "start_mono_ns", "start_time", "attributes")
+
+# _start_span results that mean "just call the function": the root decided not to sample (the
+# marker must be cleared afterwards), or we're nested inside such a root.
+_UNSAMPLED_ROOT = object()
+_UNSAMPLED = object()
+
+def _start_span(apm_client_instance, attributes: Dict[str, Any]):
+    # one lookup for the trace id and its span list
+    trace = get_trace_context()
+    is_root_trace = trace is None
+
+    if is_root_trace:
+        if not apm_client_instance.should_sample():
+            # remember the decision so nested spans skip their bookkeeping too
+            start_trace_context(None)
+            return _UNSAMPLED_ROOT
+        trace = start_trace_context(generate_uuid())
+    elif trace.trace_id is None: # inside an unsampled trace
+        return _UNSAMPLED
+
+    span = _Span()
+    span.client = apm_client_instance
+    span.trace = trace
+    span.is_root = is_root_trace
+    span.parent_span_id = get_current_span_id()
+    span.span_id = generate_span_id()
+    set_current_span_id(span.span_id)
+
+    span.start_time = UtcTimestamp(now_ns()) # shared by the span and the trace payload; formatted when sent
+    span.attributes = attributes # the decorator's snapshot; only copied if the span records an error
+    span.start_mono_ns = monotonic_ns()
+    return span
+
+def _finish_span(span: _Span, name: str, span_type: str, error: Optional[BaseException]):
+    duration_ms = (monotonic_ns() - span.start_mono_ns) / 1_000_000
+    if error is not None:
+        span.attributes = {**span.attributes, "error": True, "error.message": str(error)}
+
+    span_data = {
+        "id": span.span_id,
+        "parent_id": span.parent_span_id, # already a str (or None)
+        "name": name,
+        "span_type": span_type,
+        "start_time": span.start_time,
+        "duration_ms": duration_ms,
+        "attributes": span.attributes
+    }
+    span.trace.spans.append(span_data)
+    set_current_span_id(span.parent_span_id)
+
+    if span.is_root:
+        # server_id and service_name are added by the client when the batch is encoded
+        trace_payload = {
+            "timestamp": span.start_time,
+            "duration_ms": duration_ms,
+            "endpoint": name,
+            "status_code": 500 if error is not None else 200,
+            "attributes": _NO_ATTRIBUTES,
+            "spans": span.trace.spans
+        }
+
+        # only queues the trace; APMClient's flusher thread does the HTTP call
+        span.client.send_trace(trace_payload)
+        reset_trace_context()
+
 def trace_function(name: str, span_type: str = "function", attributes: Optional[Dict[str, Any]] = None):
+    """
+    Records a span around each call of the decorated function (a new trace if none is active).
+    Coroutine functions get an async wrapper; plain functions stay plain, synchronous calls.
+    """
+    # copied once here rather than per call; spans share it read-only
+    attributes = dict(attributes) if attributes else _NO_ATTRIBUTES
+
     def decorator(func):
-        is_coroutine_function = asyncio.iscoroutinefunction(func)
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                apm_client_instance = get_apm_client()
+                if apm_client_instance is None:
+                    return await func(*args, **kwargs)
+
+                span = _start_span(apm_client_instance, attributes)
+                if span is _UNSAMPLED:
+                    return await func(*args, **kwargs)
+                if span is _UNSAMPLED_ROOT:
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        reset_trace_context()
+
+                error = None
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    _finish_span(span, name, span_type, error)
+
+            return async_wrapper
 
         @functools.wraps(func)
-        async def async_wrapper(*args, **kwargs):
+        def sync_wrapper(*args, **kwargs):
             apm_client_instance = get_apm_client()
             if apm_client_instance is None:
-                return await func(*args, **kwargs) if is_coroutine_function else func(*args, **kwargs)
-
-            trace_id = get_current_trace_id() 
-            is_root_trace = trace_id is None 
-            
-            if is_root_trace:
-                trace_id = generate_uuid()
-                set_current_trace_id(trace_id)
-                reset_trace_context() 
-                
-            parent_span_id = get_current_span_id()
-            span_id = generate_uuid()
-            set_current_span_id(span_id)
-
-            start_time_ms = now_ms()
-            start_dt = datetime.utcfromtimestamp(start_time_ms / 1000)
-
-            result = None
-            exception_happened = False
-            span_attributes = attributes.copy() if attributes else {}
+                return func(*args, **kwargs)
 
+            span = _start_span(apm_client_instance, attributes)
+            if span is _UNSAMPLED:
+                return func(*args, **kwargs)
+            if span is _UNSAMPLED_ROOT:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    reset_trace_context()
+
+            error = None
             try:
-                if is_coroutine_function:
-                    result = await func(*args, **kwargs)
-                else:
-                    result = await asyncio.to_thread(func, *args, **kwargs)
+                return func(*args, **kwargs)
             except Exception as e:
-                exception_happened = True
-                span_attributes["error"] = True
-                span_attributes["error.message"] = str(e)
+                error = e
                 raise
             finally:
-                end_time_ms = now_ms()
-                duration_ms = end_time_ms - start_time_ms
-
-                span_data = {
-                    "id": str(span_id),
-                    "parent_id": str(parent_span_id) if parent_span_id else None,
-                    "name": name,
-                    "span_type": span_type,
-                    "start_time": start_dt.isoformat(timespec='milliseconds') + 'Z',
-                    "duration_ms": duration_ms,
-                    "attributes": span_attributes 
-                }
-                push_span_to_stack(span_data)
-                set_current_span_id(parent_span_id) 
-                
-                if is_root_trace:
-                    all_spans_for_trace = get_span_stack()
-                    trace_payload = {
-                        "server_id": str(apm_client_instance.server_id), 
-                        "timestamp": start_dt.isoformat(timespec='milliseconds') + 'Z',
-                        "duration_ms": duration_ms,
-                        "service_name": urlparse(apm_client_instance.backend_url).hostname or "unknown-service", 
-                        "endpoint": name, 
-                        "status_code": 500 if exception_happened else 200, 
-                        "attributes": {}, 
-                        "spans": all_spans_for_trace
-                    }
-                    
-                    asyncio.create_task(
-                        asyncio.to_thread(apm_client_instance.send_trace, trace_payload)
-                    )
-                    reset_trace_context()
-
-            return result
+                _finish_span(span, name, span_type, error)
 
-        return async_wrapper
+        return sync_wrapper
     return decorator
 
 def trace_http_request(name: str, attributes: Optional[Dict[str, Any]] = None):
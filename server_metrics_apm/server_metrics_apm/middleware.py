@@ -1,44 +1,70 @@
-import asyncio
-from datetime import datetime
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
 from starlette.types import ASGIApp
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 
-from .utils import generate_uuid, now_ms
+from .utils import _NO_ATTRIBUTES, UtcTimestamp, generate_span_id, generate_uuid, monotonic_ns, now_ns
 from server_metrics_apm import get_apm_client
 from server_metrics_apm.context import ( 
-    set_current_trace_id,
+    start_trace_context,
     set_current_span_id,
-    get_span_stack, 
-    reset_trace_context,
-    push_span_to_stack
+    reset_trace_context
 )
-from urllib.parse import urlparse
+
+# Trace ingestion itself is never traced (a backend monitoring itself would otherwise loop).
+_TRACE_INGEST_PATHS = frozenset(("/api/v1/apm/traces", "/api/v1/apm/traces/bulk"))
+
+def _request_url(scope) -> str:
+    """The request URL straight from the ASGI scope (what str(request.url) gives, without building a URL object)."""
+    host = None
+    for key, value in scope["headers"]:
+        if key == b"host":
+            host = value.decode("latin-1")
+            break
+    if host is None:
+        server = scope.get("server")
+        host = f"{server[0]}:{server[1]}" if server else ""
+    url = f"{scope['scheme']}://{host}{scope.get('root_path', '')}{scope['path']}"
+    query_string = scope.get("query_string")
+    if query_string:
+        url += "?" + query_string.decode("latin-1")
+    return url
 
 class APMMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
+    """
+    Records one trace per HTTP request. Requests whose path starts with one of ignore_paths
+    (health checks, favicon, ...) skip all tracing work.
+    """
+    def __init__(self, app: ASGIApp, ignore_paths: Iterable[str] = ()):
         super().__init__(app)
+        self._skip_prefixes = tuple(ignore_paths)
 
     async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        apm_client_instance = get_apm_client()
-        if apm_client_instance is None:
+        # the raw ASGI path; request.url would parse and rebuild the whole URL
+        path = request.scope["path"]
+        if (path in _TRACE_INGEST_PATHS and request.method == "POST") or path.startswith(self._skip_prefixes):
             return await call_next(request)
 
-        if request.url.path == "/api/v1/apm/traces" and request.method == "POST":
+        apm_client_instance = get_apm_client()
+        if apm_client_instance is None:
             return await call_next(request)
         
-        reset_trace_context() 
+        if not apm_client_instance.should_sample():
+            # unsampled: mark the request so decorated functions inside it skip tracing as well
+            start_trace_context(None)
+            try:
+                return await call_next(request)
+            finally:
+                reset_trace_context()
 
-        trace_id = generate_uuid()
-        set_current_trace_id(trace_id) 
+        trace = start_trace_context(generate_uuid())
         
-        root_span_id = generate_uuid()
+        root_span_id = generate_span_id()
         set_current_span_id(root_span_id) 
 
-        start_time_ms = now_ms()
-        start_dt = datetime.utcfromtimestamp(start_time_ms / 1000)
+        start_time = UtcTimestamp(now_ns()) # shared by the span and the trace payload; formatted when sent
+        start_mono_ns = monotonic_ns() # durations come from the monotonic clock
 
         response: Optional[Response] = None
         status_code: int = 500 
@@ -52,12 +78,11 @@ class APMMiddleware(BaseHTTPMiddleware):
             captured_exception = e
             raise  
         finally:
-            end_time_ms = now_ms()
-            duration_ms = end_time_ms - start_time_ms
+            duration_ms = (monotonic_ns() - start_mono_ns) / 1_000_000
 
             root_span_attributes: Dict[str, Any] = {
                 "http.method": request.method,
-                "http.url": str(request.url),
+                "http.url": _request_url(request.scope),
                 "http.status_code": status_code,
             }
             if request.scope and 'route' in request.scope:
@@ -69,32 +94,30 @@ class APMMiddleware(BaseHTTPMiddleware):
                 root_span_attributes["error.message"] = f"Unhandled exception during request: {type(captured_exception).__name__}" 
 
             root_span_data = {
-                "id": str(root_span_id),
+                "id": root_span_id,
                 "parent_id": None, 
-                "name": f"{request.method} {root_span_attributes.get('http.route', str(request.url.path))}",
+                "name": f"{request.method} {root_span_attributes.get('http.route', path)}",
                 "span_type": "http",
-                "start_time": start_dt.isoformat(timespec='milliseconds') + 'Z',
+                "start_time": start_time,
                 "duration_ms": duration_ms,
                 "attributes": root_span_attributes
             }
-            push_span_to_stack(root_span_data) 
+            trace.spans.append(root_span_data) 
 
-            all_spans_for_trace = get_span_stack() 
+            all_spans_for_trace = trace.spans 
 
+            # server_id and service_name are added by the client when the batch is encoded
             trace_payload = {
-                "server_id": str(apm_client_instance.server_id), 
-                "timestamp": start_dt.isoformat(timespec='milliseconds') + 'Z',
+                "timestamp": start_time,
                 "duration_ms": duration_ms,
-                "service_name": urlparse(apm_client_instance.backend_url).hostname,                
-                "endpoint": root_span_attributes.get('http.route', str(request.url.path)),
+                "endpoint": root_span_attributes.get('http.route', path),
                 "status_code": status_code,
-                "attributes": {}, 
+                "attributes": _NO_ATTRIBUTES,
                 "spans": all_spans_for_trace
             }
 
-            asyncio.create_task(
-                asyncio.to_thread(apm_client_instance.send_trace, trace_payload)
-            )
+            # only queues the trace; APMClient's flusher thread does the HTTP call
+            apm_client_instance.send_trace(trace_payload)
 
             reset_trace_context() 
 
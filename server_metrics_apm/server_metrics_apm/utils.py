@@ -1,10 +1,91 @@
+import os
+import threading
 import uuid
 import time
+from typing import Any, Dict
+
+# Shared, never mutated: spans without attributes and every trace payload's "attributes" point here
+# instead of allocating a fresh empty dict per call (queued payloads are only ever serialized).
+_NO_ATTRIBUTES: Dict[str, Any] = {}
+
+# Random bytes for generate_uuid are drawn from the OS in blocks of this many UUIDs (per thread).
+_UUID_POOL_SIZE = 256
+_uuid_pool = threading.local()
+
+def _reset_uuid_pool():
+    # A forked worker must not hand out the same UUIDs as its parent.
+    _uuid_pool.__dict__.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_uuid_pool)
+
+def _random_16() -> bytes:
+    pool = getattr(_uuid_pool, "bytes", b"")
+    pos = getattr(_uuid_pool, "pos", 0)
+    if pos >= len(pool):
+        pool = _uuid_pool.bytes = os.urandom(16 * _UUID_POOL_SIZE)
+        pos = 0
+    _uuid_pool.pos = pos + 16
+    return pool[pos:pos + 16]
+
+class _FastUUID(uuid.UUID):
+    """A UUID that formats itself once, however many times it is stringified."""
+    __slots__ = ("_str",)
+
+    def __str__(self) -> str:
+        try:
+            return self._str
+        except AttributeError:
+            text = super().__str__()
+            object.__setattr__(self, "_str", text)
+            return text
 
 def generate_uuid() -> uuid.UUID:
-    """Generates a new UUID v4."""
-    return uuid.uuid4()
+    """Generates a new UUID v4, from a per-thread pool of os.urandom bytes (one syscall per _UUID_POOL_SIZE ids)."""
+    return _FastUUID(bytes=_random_16(), version=4)
+
+def generate_span_id() -> str:
+    """
+    Generates a new UUID v4 already in its string form (what span ids are sent and stored as),
+    formatted straight from the random bytes without building a UUID object.
+    """
+    raw = bytearray(_random_16())
+    raw[6] = (raw[6] & 0x0F) | 0x40 # version 4
+    raw[8] = (raw[8] & 0x3F) | 0x80 # RFC 4122 variant
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def now_ns() -> int:
+    """Returns the current time in nanoseconds since epoch (wall clock: for timestamps, not durations)."""
+    return time.time_ns()
+
+def monotonic_ns() -> int:
+    """Returns a monotonic clock reading in nanoseconds; durations measured with it can't go negative when NTP steps the clock."""
+    return time.monotonic_ns()
+
+def iso_utc_ms(ns: int) -> str:
+    """Formats nanoseconds since epoch as an ISO-8601 UTC timestamp with milliseconds, e.g. 2024-01-31T12:00:00.123Z."""
+    seconds, rem = divmod(ns, 1_000_000_000)
+    tm = time.gmtime(seconds)
+    return (
+        f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d}"
+        f"T{tm.tm_hour:02d}:{tm.tm_min:02d}:{tm.tm_sec:02d}.{rem // 1_000_000:03d}Z"
+    )
+
+class UtcTimestamp:
+    """
+    A span/trace start time kept as nanoseconds since epoch. Formatting (iso_utc_ms) is deferred
+    to serialization, which happens on the client's flusher thread rather than the traced request.
+    """
+    __slots__ = ("ns",)
+
+    def __init__(self, ns: int):
+        self.ns = ns
+
+    def isoformat(self) -> str:
+        return iso_utc_ms(self.ns)
+
+    __str__ = isoformat
 
-def now_ms() -> float:
-    """Returns the current time in milliseconds since epoch."""
-    return time.time() * 1000
\ No newline at end of file
+    def __repr__(self) -> str:
+        return f"UtcTimestamp({self.isoformat()})"